@@ -15,7 +15,6 @@ import sys
 from cx_Freeze import setup, Executable
 import shutil
 from pyqode.core.api.syntax_highlighter import get_all_styles
-from pyqode.python.backend import server
 
 # from src.uPyIDE import __version__
 
@@ -60,7 +59,7 @@ setup(name="uPyIDE",
                      packages='uPyIDE',
                      icon='share/uPyIDE/images/uPyIDE.ico',
                      base="Win32GUI"),
-          Executable(server.__file__.replace('.pyc', '.py'),
+          Executable(os.path.join('src', 'server.py'),
                      targetName="server.exe")])
 
 
@@ -81,4 +80,4 @@ except OSError:
     pass
 
 # also copy server.py in order to be able to run on external interpreters
-shutil.copy(server.__file__, 'bin')
+shutil.copy(os.path.join('src', 'server.py'), 'bin')
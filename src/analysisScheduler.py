@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Central scheduler for the editors' backend analysis (linters and outline).
+
+Each PyCodeEdit normally runs its checker and outline modes on its own timers
+whenever its text changes, visible or not. The scheduler takes the requests
+the modes make to their job runners (DelayJobRunner.request_job) and leaves
+the modes themselves alone: pyqode connects and disconnects their slots as
+usual. Only the active editor is analysed, background editors are just
+marked pending and analysed once when they are shown again. A new edit
+supersedes any request still waiting. analysed is emitted with each editor
+analysed, for work that should follow the edits at the same pace.
+"""
+import functools
+
+import pyqode.qt.QtCore as QtCore
+from pyqode.core.api.utils import DelayJobRunner
+from pyqode.core.modes import CheckerMode, OutlineMode
+
+
+class AnalysisScheduler(QtCore.QObject):
+    analysed = QtCore.Signal(object)
+
+    # the mode timers already debounce the edits
+    def __init__(self, parent=None, delay=100):
+        super(AnalysisScheduler, self).__init__(parent)
+        self._active = None
+        # editor: {runner: (job, args)} of the requests waiting
+        self._pending = {}
+        self._editors = set()
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._runActive)
+
+    @staticmethod
+    def _modes(editor):
+        return [m for m in editor.modes
+                if isinstance(m, (CheckerMode, OutlineMode))]
+
+    @classmethod
+    def _runners(cls, editor):
+        return [r for m in cls._modes(editor) for r in vars(m).values()
+                if isinstance(r, DelayJobRunner)]
+
+    def register(self, editor):
+        self._editors.add(editor)
+        for runner in self._runners(editor):
+            # the runner is not a slot, pyqode never disconnects it
+            runner.request_job = functools.partial(self._request, editor,
+                                                   runner)
+
+    def unregister(self, editor):
+        self._pending.pop(editor, None)
+        if editor in self._editors:
+            self._editors.discard(editor)
+            for runner in self._runners(editor):
+                runner.__dict__.pop('request_job', None)
+        if editor is self._active:
+            self._active = None
+            self._timer.stop()
+
+    def setActive(self, editor):
+        self._active = editor
+        self._timer.stop()
+        if editor in self._pending:
+            self._timer.start(0)
+
+    def _request(self, editor, runner, job, *args):
+        self._pending.setdefault(editor, {})[runner] = (job, args)
+        if editor is self._active:
+            # restarting drops the request still waiting for this editor
+            self._timer.start()
+
+    def _runActive(self):
+        editor = self._active
+        if editor not in self._pending:
+            return
+        if not all(getattr(m, '_finished', True) for m in self._modes(editor)):
+            # a previous analysis is still running, try again later
+            self._timer.start()
+            return
+        for job, args in self._pending.pop(editor).values():
+            job(*args)
+        self.analysed.emit(editor)
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Crash-safe autosave journal.
+
+Editor changes are appended as small json records to ~/.uPyIDE/journal:
+
+- ``base``: the text an editor starts from, ``text`` is None when it is the
+  file on disk (just opened or saved)
+- ``delta``: a change at ``pos``, ``removed`` characters replaced by ``added``
+- ``close``: the editor was closed
+
+Deltas are buffered and flushed about once a second by a writer thread, so
+typing never waits on the disk and each write is the size of the change,
+not of the file. The journal is compacted to one base per editor once it
+grows past COMPACT_SIZE, and removed on a clean exit. If it is still there
+at startup, recover() replays it.
+"""
+import functools
+import json
+import os
+import queue
+import threading
+
+import pyqode.qt.QtCore as QtCore
+import pyqode.qt.QtGui as QtGui
+
+FLUSH_INTERVAL = 1000
+COMPACT_SIZE = 512 * 1024
+
+
+class Journal(object):
+    '''
+    Append-only record file written from a background thread
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._writer)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def append(self, records):
+        data = ''.join(json.dumps(r) + '\n' for r in records)
+        self.size += len(data)
+        self._queue.put(('append', data))
+
+    def rewrite(self, records):
+        data = ''.join(json.dumps(r) + '\n' for r in records)
+        self.size = len(data)
+        self._queue.put(('rewrite', data))
+
+    def close(self, remove=False):
+        self._queue.put(('remove' if remove else 'stop', None))
+        self._thread.join()
+
+    def _writer(self):
+        while True:
+            op, data = self._queue.get()
+            try:
+                if op == 'append':
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(data)
+                        # drain what queued up meanwhile in the same write
+                        while True:
+                            try:
+                                op, data = self._queue.get_nowait()
+                            except queue.Empty:
+                                break
+                            if op != 'append':
+                                break
+                            f.write(data)
+                        f.flush()
+                    if op == 'append':
+                        continue
+                if op == 'rewrite':
+                    tmp = self.path + '.tmp'
+                    with open(tmp, 'w', encoding='utf-8') as f:
+                        f.write(data)
+                    os.replace(tmp, self.path)
+                elif op == 'remove':
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+                    return
+                elif op == 'stop':
+                    return
+            except (IOError, OSError) as e:
+                print(('autosave journal: ', e))
+
+
+def recover(path):
+    """ Replay a journal left by a crash
+        :returns:
+            A list of (file path, text) for the editors with unsaved changes
+    """
+    editors = {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            lines = f.readlines()
+    except (IOError, OSError):
+        return []
+    for line in lines:
+        try:
+            r = json.loads(line)
+        except ValueError:
+            # the last record may be cut by the crash
+            continue
+        eid = r.get('id')
+        if r['op'] == 'base':
+            editors[eid] = {'path': r.get('path'), 'text': r.get('text'),
+                            'dirty': False}
+        elif r['op'] == 'delta' and eid in editors:
+            e = editors[eid]
+            if e['text'] is None:
+                try:
+                    with open(e['path'], encoding='utf-8') as f:
+                        e['text'] = f.read()
+                except (IOError, OSError, TypeError):
+                    e['text'] = ''
+            text, pos = e['text'], r['pos']
+            e['text'] = text[:pos] + r['added'] + text[pos + r['removed']:]
+            e['dirty'] = True
+        elif r['op'] == 'close':
+            editors.pop(eid, None)
+    return [(e['path'], e['text']) for e in editors.values() if e['dirty']]
+
+
+class AutosaveJournal(QtCore.QObject):
+    '''
+    Records the changes of the registered editors in a Journal
+    '''
+    def __init__(self, path, parent=None):
+        super(AutosaveJournal, self).__init__(parent)
+        self.journal = Journal(path)
+        self.journal.rewrite([])
+        self._ids = {}
+        self._next = 0
+        self._pending = []
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(FLUSH_INTERVAL)
+        self._timer.timeout.connect(self.flush)
+
+    def _base(self, editor):
+        path = editor.file.path
+        on_disk = path and os.path.isfile(path) and not editor.dirty
+        return {'op': 'base', 'id': self._ids[editor], 'path': path,
+                'text': None if on_disk else editor.toPlainText()}
+
+    def register(self, editor):
+        self._ids[editor] = self._next
+        self._next += 1
+        self._queue(self._base(editor))
+        editor.document().contentsChange.connect(
+            functools.partial(self._changed, editor))
+        editor.dirty_changed.connect(
+            functools.partial(self._dirtyChanged, editor))
+        editor.new_text_set.connect(
+            functools.partial(self._rebase, editor))
+
+    def unregister(self, editor):
+        eid = self._ids.pop(editor, None)
+        if eid is not None:
+            self._queue({'op': 'close', 'id': eid})
+
+    def _queue(self, record):
+        self._pending.append(record)
+        # throttle, not debounce: a long typing burst still gets flushed
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def _changed(self, editor, pos, removed, added):
+        if editor not in self._ids:
+            return
+        text = ''
+        if added:
+            cursor = QtGui.QTextCursor(editor.document())
+            cursor.setPosition(pos)
+            cursor.setPosition(pos + added, QtGui.QTextCursor.KeepAnchor)
+            text = cursor.selectedText().replace(u'\u2029', '\n')
+        self._queue({'op': 'delta', 'id': self._ids[editor], 'pos': pos,
+                     'removed': removed, 'added': text})
+
+    def _dirtyChanged(self, editor, dirty):
+        if not dirty:
+            self._rebase(editor)
+
+    def _rebase(self, editor):
+        if editor in self._ids:
+            self._queue(self._base(editor))
+
+    def flush(self):
+        if self._pending:
+            self.journal.append(self._pending)
+            self._pending = []
+        if self.journal.size > COMPACT_SIZE:
+            self.compact()
+
+    def compact(self):
+        self._pending = []
+        self.journal.rewrite([self._base(editor) for editor in self._ids])
+
+    def close(self):
+        '''clean exit, nothing to recover'''
+        self._timer.stop()
+        self.journal.close(remove=True)
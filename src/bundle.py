@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single stream bundle upload.
+
+Many files are sent in one raw REPL session: the UNPACKER script runs on the
+board and reads the bundle from stdin one line at a time, asking for each
+line with ``#A`` so its input buffer never overflows. A bundle is::
+
+    F <size> <sha256> <remote path>
+    <base64 lines of the file data>
+    Z <size> <sha256> <remote path>
+    B <compressed size>
+    <base64 lines of a deflated block>
+    ...
+    E
+
+Each line is numbered and framed with its crc32 (see LINE_READER). The board
+asks for each line by number with ``#A <n>``, again with ``#R <n>`` when it
+arrives corrupted, and skips lines sent twice. When the board stays silent
+the host sends an empty line, which the board answers with ``#R``, so a
+lost request does not stall the upload. A file is written to a ``.part`` file
+named after its hash and renamed once complete, the board answers each
+header with ``#O <offset>``, the size of that part file, so an upload cut
+by a disconnect resumes where it stopped on the next try.
+
+``Z`` files are deflated on the host in independent ZBLOCK blocks, so the
+board inflates each block alone in little memory. The PROBE script tells
+which inflater the firmware has, and whether it can check the line crcs;
+choose_compression() then decides per file
+whether the bytes saved on the link outweigh the inflate time on the board.
+
+The unpacker creates missing directories, writes each file through a small
+buffer, checks the sha256 when uhashlib is available and prints ``#OK path``
+or ``#BAD path`` per file.
+"""
+import binascii
+import functools
+import hashlib
+import re
+import threading
+import zlib
+
+from replSession import output_text
+
+#: Bytes of file data per base64 line, keeps lines under the board buffer
+LINE_DATA = 144
+
+ACK = b'#A'
+TOKEN = re.compile(br'#([ARO] \d+)\r?\n')
+# raw REPL end of output
+END = b'\x04'
+
+#: Raw bytes deflated together, and the deflate window the board needs
+ZBLOCK = 4096
+ZWBITS = 12
+
+#: Times the board asks again for a corrupted line before giving up
+RETRIES = 8
+
+#: Seconds of silence before the host asks the board to repeat its request
+ACK_TIMEOUT = 1
+
+#: Seconds per line for the #A round trip, and bytes inflated per second on
+#: the board, measured on an EDU-CIAA
+LINE_LATENCY = 0.002
+INFLATE_RATE = 60000
+
+PROBE = '''
+try:
+    import deflate
+    print('#Z deflate')
+except ImportError:
+    try:
+        import zlib
+        print('#Z zlib')
+    except ImportError:
+        try:
+            import uzlib
+            print('#Z zlib')
+        except ImportError:
+            print('#Z none')
+try:
+    import ubinascii as _b
+except ImportError:
+    import binascii as _b
+print('#C', 'crc32' if hasattr(_b, 'crc32') else 'none')
+del _b
+'''
+
+#: Device side line reader shared by the upload scripts: every line is
+#: ``<crc32 hex> <number> <payload>``, a line failing its crc is asked again
+#: with ``#R <number>``, one with another number was sent twice and is
+#: skipped. Without ubinascii.crc32 only the final sha256 protects the data.
+LINE_READER = '''
+try:
+    _crc = _b.crc32
+except AttributeError:
+    _crc = None
+_n = 0
+def _get():
+    r = 0
+    while r < {retries}:
+        c, _, l = sys.stdin.readline().strip().partition(' ')
+        try:
+            if _crc is None or int(c, 16) == _crc(l.encode()) & 0xffffffff:
+                s, _, l = l.partition(' ')
+                if int(s) == _n:
+                    return l
+                continue
+        except ValueError:
+            pass
+        r += 1
+        print('#R', _n)
+    raise OSError('link')
+def _line():
+    global _n
+    _n += 1
+    print('#A', _n)
+    return _get()
+'''.format(retries=RETRIES)
+
+UNPACKER = '''
+import sys, os
+try:
+    import ubinascii as _b
+except ImportError:
+    import binascii as _b
+try:
+    import uhashlib as _h
+except ImportError:
+    _h = None
+try:
+    import deflate as _z, io
+    def _inflate(b):
+        return _z.DeflateIO(io.BytesIO(b), _z.RAW, {wbits}).read()
+except ImportError:
+    try:
+        import zlib as _z
+    except ImportError:
+        try:
+            import uzlib as _z
+        except ImportError:
+            _z = None
+    def _inflate(b):
+        return _z.decompress(b, -{wbits})
+def _mkdirs(p):
+    d = ''
+    for part in p.split('/')[1:-1]:
+        d += '/' + part
+        try:
+            os.mkdir(d)
+        except OSError:
+            pass
+{reader}
+def _unpack():
+    while True:
+        h = _line().split(' ', 3)
+        if h[0] not in ('F', 'Z'):
+            break
+        size = int(h[1])
+        _mkdirs(h[3])
+        part = h[3] + '.' + h[2][:8] + '.part'
+        try:
+            done = os.stat(part)[6]
+        except OSError:
+            done = 0
+        if done > size or h[0] == 'Z' and done % {zblock}:
+            done = 0
+        s = _h.sha256() if _h else None
+        if done and s:
+            with open(part, 'rb') as f:
+                while True:
+                    b = f.read(512)
+                    if not b:
+                        break
+                    s.update(b)
+        print('#O', done)
+        with open(part, 'ab' if done else 'wb') as f:
+            while done < size:
+                if h[0] == 'Z':
+                    n = int(_line()[2:])
+                    b = b''
+                    while len(b) < n:
+                        b += _b.a2b_base64(_line())
+                    b = _inflate(b)
+                else:
+                    b = _b.a2b_base64(_line())
+                f.write(b)
+                if s:
+                    s.update(b)
+                done += len(b)
+        ok = s is None or _b.hexlify(s.digest()).decode() == h[2]
+        if ok:
+            try:
+                os.remove(h[3])
+            except OSError:
+                pass
+            os.rename(part, h[3])
+        else:
+            os.remove(part)
+        print('#OK' if ok else '#BAD', h[3])
+_unpack()
+del _unpack, _line, _get, _n, _mkdirs, _inflate
+'''.format(wbits=ZWBITS, zblock=ZBLOCK, reader=LINE_READER)
+
+
+def parse_probe(raw):
+    """ Inflater of the firmware from the PROBE output, None if it has none """
+    text = output_text(raw)
+    for line in text.splitlines():
+        if line.startswith('#Z '):
+            name = line[3:].strip()
+            return None if name == 'none' else name
+    return None
+
+
+def crc_checked(raw):
+    """ False if the PROBE output says the board can not check line crcs """
+    return '#C none' not in output_text(raw)
+
+
+def deflate_blocks(data):
+    """ Raw deflate streams of the ZBLOCK blocks of data """
+    for i in range(0, len(data), ZBLOCK):
+        z = zlib.compressobj(9, zlib.DEFLATED, -ZWBITS)
+        yield z.compress(data[i:i + ZBLOCK]) + z.flush()
+
+
+def _link_time(size, baud):
+    """ Seconds to send size bytes as acknowledged base64 lines """
+    lines = -(-size // LINE_DATA)
+    # crc, number and newline, and the numbered #A request per line
+    wire = size * 4 // 3 + lines * (9 + 6 + 1 + len(ACK) + 6 + 2)
+    # 10 bits per byte on the UART
+    return wire * 10.0 / baud + lines * LINE_LATENCY
+
+
+def choose_compression(data, baud):
+    """ Deflated blocks of data if sending them is faster at baud, else None
+    """
+    blocks = list(deflate_blocks(data))
+    raw_time = _link_time(len(data), baud)
+    z_time = sum(_link_time(len(b), baud) + LINE_LATENCY for b in blocks) + \
+        len(data) / float(INFLATE_RATE)
+    return blocks if z_time < raw_time else None
+
+
+def frame(payload, number):
+    """ Line number of payload with their crc32, as _get() on the board reads
+        it
+    """
+    line = b'%d ' % number + payload
+    return b'%08x ' % (binascii.crc32(line) & 0xffffffff) + line + b'\n'
+
+
+def _data_lines(data, blocks, offset):
+    if blocks:
+        # the board resumes deflated files at a block boundary
+        for block in blocks[offset // ZBLOCK:]:
+            yield b'B %d' % len(block)
+            for i in range(0, len(block), LINE_DATA):
+                yield binascii.b2a_base64(block[i:i + LINE_DATA])[:-1]
+    else:
+        for i in range(offset, len(data), LINE_DATA):
+            yield binascii.b2a_base64(data[i:i + LINE_DATA])[:-1]
+
+
+def pack_files(files, inflater=None, baud=115200):
+    """ Header line and data lines function of offset for each of a list of
+        (remote_path, data), files are deflated when the board has an
+        inflater and it pays off at baud. Lines are payloads, StreamSender
+        frames them
+    """
+    for path, data in files:
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        blocks = choose_compression(data, baud) if inflater else None
+        header = '{} {} {} {}'.format('Z' if blocks else 'F', len(data),
+                                      hashlib.sha256(data).hexdigest(), path)
+        yield (header.encode('utf-8'),
+               functools.partial(_data_lines, data, blocks))
+
+
+def pack_lines(files, inflater=None, baud=115200):
+    """ Bundle lines for a list of (remote_path, data) written from scratch
+    """
+    for header, data_lines in pack_files(files, inflater, baud):
+        yield header
+        for line in data_lines(0):
+            yield line
+    yield b'E'
+
+
+def parse_result(raw):
+    """ Returns the (written, corrupted) remote paths from unpacker output """
+    text = output_text(raw)
+    ok, bad = [], []
+    for line in text.splitlines():
+        if line.startswith('#OK '):
+            ok.append(line[4:].strip())
+        elif line.startswith('#BAD '):
+            bad.append(line[5:].strip())
+    return ok, bad
+
+
+class StreamSender(object):
+    '''
+    Terminal interceptor framing and writing the next line of payloads each
+    time the board asks for one with #A, the same line again on #R. An empty
+    line makes the board repeat its request when it stays silent for
+    ACK_TIMEOUT. Detaches when the script ends.
+    '''
+    def __init__(self, lines, write):
+        self._lines = iter(lines)
+        self._number = 0
+        self._last = b''
+        self._write = write
+        self._buf = b''
+        self._lock = threading.Lock()
+        self._timer = None
+        self._pokes = 0
+        self._done = False
+
+    def __call__(self, text):
+        with self._lock:
+            self._buf += text
+            while True:
+                found = TOKEN.search(self._buf)
+                if END in self._buf[:found.start() if found else None]:
+                    self._done = True
+                    if self._timer:
+                        self._timer.cancel()
+                    return True
+                if not found:
+                    # keep a possible partial token only
+                    cut = self._buf.rfind(b'#')
+                    self._buf = self._buf[cut:] if cut >= 0 else b''
+                    # the first request may be the one lost
+                    self._watch()
+                    return False
+                self._buf = self._buf[found.end():]
+                self._pokes = 0
+                self._token(found.group(1))
+
+    def _token(self, token):
+        number = int(token[2:])
+        if number == self._number + 1:
+            # an #R when the board answers a poke after a lost #A
+            self._number = number
+            payload = next(self._lines, None)
+            self._last = b'' if payload is None else frame(payload, number)
+        if number == self._number and self._last:
+            self._write(self._last)
+
+    def _watch(self):
+        if self._timer:
+            self._timer.cancel()
+        self._timer = threading.Timer(ACK_TIMEOUT, self._poke)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _poke(self):
+        with self._lock:
+            if self._done or self._pokes >= RETRIES:
+                # past that the remoteExec timeout gives the transfer up
+                return
+            self._pokes += 1
+            # fails its crc, the board asks again for the line it waits for
+            self._write(b'\n')
+            self._watch()
+
+
+class BundleSender(StreamSender):
+    '''
+    Sends a bundle, each file from the offset the board already has
+    '''
+    def __init__(self, files, write, inflater=None, baud=115200):
+        self._files = pack_files(files, inflater, baud)
+        self._offset = 0
+        super(BundleSender, self).__init__(self._stream(), write)
+
+    def _stream(self):
+        for header, data_lines in self._files:
+            yield header
+            # the board answers the header with #O before asking for data
+            for line in data_lines(self._offset):
+                yield line
+        yield b'E'
+
+    def _token(self, token):
+        if token.startswith(b'O '):
+            self._offset = int(token[2:])
+        else:
+            super(BundleSender, self)._token(token)
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Block level delta upload, rsync like.
+
+The SIGNATURE script makes the board print a weak checksum and a short hash
+of each BLOCK_SIZE block of the remote file. make_delta() then looks for
+those blocks in the new content at any offset, so inserting a line does not
+shift every block after it: the weak checksum rolls over the data a byte at
+a time to find candidates, and only they are hashed to confirm the match.
+The new file is described as block copies and literal data::
+
+    C <first block> <count>
+    D <base64 data>
+    E <size> <sha256>
+
+The PATCHER script reads these lines from stdin (crc framed and asked with
+``#A``, as the bundle unpacker does), writes the new file to a temp file
+copying blocks from the old one, and only replaces the old file when the
+sha256 of the result matches. It prints ``#OK path`` or ``#BAD path``.
+"""
+import binascii
+import hashlib
+
+from bundle import LINE_DATA, LINE_READER
+from replSession import output_text
+
+BLOCK_SIZE = 512
+
+#: Smaller files are sent whole, the signature would not pay off
+MIN_SIZE = 4 * 1024
+
+SIGNATURE = '''
+try:
+    import ubinascii as _b
+except ImportError:
+    import binascii as _b
+try:
+    import uhashlib as _h
+except ImportError:
+    import hashlib as _h
+def _sig(path, bs):
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        print('#N')
+        return
+    with f:
+        while True:
+            b = f.read(bs)
+            if not b:
+                break
+            s = t = 0
+            for x in b:
+                s += x
+                t += s
+            print('#B', '%08x' % ((t & 0xffff) << 16 | s & 0xffff),
+                  _b.hexlify(_h.sha256(b).digest()[:8]).decode())
+    print('#E')
+_sig({path!r}, {bs})
+del _sig
+'''
+
+PATCHER = '''
+import sys, os
+try:
+    import ubinascii as _b
+except ImportError:
+    import binascii as _b
+try:
+    import uhashlib as _h
+except ImportError:
+    import hashlib as _h
+{reader}
+def _patch(path, bs):
+    tmp = path + '.tmp'
+    s = _h.sha256()
+    size = 0
+    with open(path, 'rb') as old:
+        with open(tmp, 'wb') as new:
+            while True:
+                op = _line().split(' ')
+                if op[0] == 'C':
+                    old.seek(int(op[1]) * bs)
+                    for i in range(int(op[2])):
+                        b = old.read(bs)
+                        new.write(b)
+                        s.update(b)
+                        size += len(b)
+                elif op[0] == 'D':
+                    b = _b.a2b_base64(op[1])
+                    new.write(b)
+                    s.update(b)
+                    size += len(b)
+                else:
+                    break
+    ok = size == int(op[1]) and _b.hexlify(s.digest()).decode() == op[2]
+    if ok:
+        os.remove(path)
+        os.rename(tmp, path)
+    else:
+        os.remove(tmp)
+    print('#OK' if ok else '#BAD', path)
+_patch({path!r}, {bs})
+del _patch, _line, _get, _n
+'''
+
+
+def signature_script(remote_path, block_size=BLOCK_SIZE):
+    return SIGNATURE.format(path=remote_path, bs=block_size)
+
+
+def patcher_script(remote_path, block_size=BLOCK_SIZE):
+    return PATCHER.format(path=remote_path, bs=block_size,
+                          reader=LINE_READER)
+
+
+def block_hash(block):
+    return hashlib.sha256(block).hexdigest()[:16]
+
+
+def weak_sums(block):
+    """ The two running sums of the weak checksum, as the board does """
+    a = b = 0
+    for x in bytearray(block):
+        a += x
+        b += a
+    return a & 0xffff, b & 0xffff
+
+
+def parse_signature(raw):
+    """ Block checksums printed by the signature script
+        :returns:
+            The list of (weak, hash) tuples, None if the remote file does not
+            exist or the output is incomplete
+    """
+    text = output_text(raw)
+    blocks = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#B '):
+            weak, strong = line[3:].split()
+            blocks.append((int(weak, 16), strong))
+        elif line == '#E':
+            return blocks
+        elif line == '#N':
+            return None
+    return None
+
+
+def make_delta(data, signature, block_size=BLOCK_SIZE):
+    """ Describe data as copies of remote blocks and literal bytes
+        :returns:
+            A list of ('C', first, count) and ('D', bytes) operations
+    """
+    table = {}
+    for n, (weak, strong) in enumerate(signature):
+        table.setdefault(weak, {}).setdefault(strong, n)
+    data = bytearray(data)
+    ops = []
+    literal = bytearray()
+    pos = 0
+    size = min(block_size, len(data))
+    a, b = weak_sums(data[:size])
+    while pos < len(data):
+        n = None
+        candidates = table.get(b << 16 | a)
+        if candidates:
+            n = candidates.get(block_hash(bytes(data[pos:pos + size])))
+        if n is None:
+            # roll the window a byte on, it shrinks at the end of the data
+            out = data[pos]
+            literal.append(out)
+            pos += 1
+            a -= out
+            b -= size * out
+            if pos + size <= len(data):
+                a += data[pos + size - 1]
+                b += a
+            else:
+                size -= 1
+            a &= 0xffff
+            b &= 0xffff
+            continue
+        if literal:
+            ops.append(('D', bytes(literal)))
+            literal = bytearray()
+        if ops and ops[-1][0] == 'C' and ops[-1][1] + ops[-1][2] == n:
+            ops[-1] = ('C', ops[-1][1], ops[-1][2] + 1)
+        else:
+            ops.append(('C', n, 1))
+        pos += size
+        size = min(block_size, len(data) - pos)
+        a, b = weak_sums(data[pos:pos + size])
+    if literal:
+        ops.append(('D', bytes(literal)))
+    return ops
+
+
+def literal_size(ops):
+    """ Bytes of data the delta sends """
+    return sum(len(op[1]) for op in ops if op[0] == 'D')
+
+
+def delta_lines(ops, data):
+    """ Patcher input lines for the delta of data, StreamSender frames them
+    """
+    for op in ops:
+        if op[0] == 'C':
+            yield 'C {} {}'.format(op[1], op[2]).encode()
+        else:
+            chunk = op[1]
+            for i in range(0, len(chunk), LINE_DATA):
+                yield b'D ' + binascii.b2a_base64(chunk[i:i + LINE_DATA])[:-1]
+    yield 'E {} {}'.format(len(data),
+                           hashlib.sha256(data).hexdigest()).encode()
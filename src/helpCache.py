@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rendered help cache.
+
+help.md is rendered to HTML once and kept under ~/.uPyIDE/help, keyed by the
+source mtime, size and sha1, so markdown is only imported when the source
+changes.
+"""
+import hashlib
+import json
+import os
+
+from myDef import cache_dir
+
+
+def _cache_files():
+    path = cache_dir('help')
+    return os.path.join(path, 'help.html'), os.path.join(path, 'help.json')
+
+
+def _load_meta(meta_file):
+    try:
+        with open(meta_file) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def _render(md_source, html_file, meta_file, meta):
+    import markdown
+    with open(md_source, 'rb') as f:
+        source = f.read()
+    html = markdown.markdown(source.decode('utf-8'))
+    with open(html_file, 'w', encoding='utf-8') as f:
+        f.write(html)
+    meta['sha1'] = hashlib.sha1(source).hexdigest()
+    with open(meta_file, 'w') as f:
+        json.dump(meta, f)
+    return html
+
+
+def render_markdown(md_source):
+    """ HTML for a markdown file, served from the cache when up to date
+        :raises IOError:
+            When the source can not be read
+        :raises ImportError:
+            When the cache is stale and markdown is not installed
+    """
+    st = os.stat(md_source)
+    html_file, meta_file = _cache_files()
+    stamp = {'source': os.path.abspath(md_source),
+             'mtime': st.st_mtime, 'size': st.st_size}
+    meta = _load_meta(meta_file)
+    fresh = os.path.exists(html_file) and \
+        all(meta.get(k) == v for k, v in stamp.items())
+    if not fresh and os.path.exists(html_file) and \
+            meta.get('source') == stamp['source']:
+        # touched but maybe not changed, compare contents before rendering
+        with open(md_source, 'rb') as f:
+            if hashlib.sha1(f.read()).hexdigest() == meta.get('sha1'):
+                meta.update(stamp)
+                with open(meta_file, 'w') as f:
+                    json.dump(meta, f)
+                fresh = True
+    if fresh:
+        with open(html_file, encoding='utf-8') as f:
+            return f.read()
+    stamp['sha1'] = None
+    return _render(md_source, html_file, meta_file, stamp)
+
+
+def help_html(md_source, html_fallback):
+    try:
+        return render_markdown(md_source)
+    except (IOError, OSError, ImportError):
+        pass
+    try:
+        with open(html_fallback, encoding='utf-8') as f:
+            return f.read()
+    except (IOError, OSError):
+        return "No help"
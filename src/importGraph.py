@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Import graph of a project, used to upload only the modules the board needs.
+
+Starting from the entry scripts (main.py and boot.py), imports are followed
+through the project files. Modules found in the stub directories (fakelibs
+and generated firmware stubs) are builtin to the firmware and are not
+uploaded; modules found nowhere are reported, they may be frozen in the
+firmware. The imports of each file are cached by content hash, so after a
+change only that file is parsed again.
+"""
+import ast
+import json
+import os
+
+ENTRY_POINTS = ('boot.py', 'main.py')
+
+#: Project directories on the board sys.path, /flash and /flash/lib
+SYS_PATH = ('', 'lib/')
+
+
+def parse_imports(source):
+    """ Imports of a module as a list of (module, level, names) """
+    tree = ast.parse(source.expandtabs(8))
+    found = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                found.append((alias.name, 0, []))
+        elif isinstance(node, ast.ImportFrom):
+            found.append((node.module or '', node.level,
+                          [alias.name for alias in node.names]))
+    return found
+
+
+class ImportGraph(object):
+    '''
+    Imports of the files of a ProjectIndex, cached next to the index
+    '''
+    def __init__(self, index, stub_dirs=()):
+        self.index = index
+        self.stub_dirs = [d for d in stub_dirs if d]
+        self.cache_file = os.path.splitext(index.index_file)[0] + \
+            '.imports.json'
+        self._imports = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                self._imports = json.load(f)
+        except (IOError, ValueError):
+            self._imports = {}
+
+    def save(self):
+        with open(self.cache_file, 'w') as f:
+            json.dump(self._imports, f)
+
+    def imports_of(self, rel):
+        """ Cached imports of a project file, parsed again if it changed """
+        info = self.index.files.get(rel)
+        if info is None:
+            return []
+        cached = self._imports.get(rel)
+        if cached and cached['sha1'] == info['sha1']:
+            return cached['imports']
+        try:
+            with open(self.index.abspath(rel), 'rb') as f:
+                imports = parse_imports(f.read().decode('utf-8', 'replace'))
+        except (IOError, SyntaxError, ValueError) as e:
+            print(('importGraph: ', rel, e))
+            imports = []
+        self._imports[rel] = {'sha1': info['sha1'], 'imports': imports}
+        return imports
+
+    def _project_module(self, dotted):
+        base = dotted.replace('.', '/')
+        for prefix in SYS_PATH:
+            for rel in (base + '.py', base + '/__init__.py'):
+                if prefix + rel in self.index.files:
+                    return prefix + rel
+        return None
+
+    def _stub_module(self, dotted):
+        base = os.path.join(*dotted.split('.'))
+        for d in self.stub_dirs:
+            if os.path.exists(os.path.join(d, base + '.py')) or \
+                    os.path.exists(os.path.join(d, base, '__init__.py')):
+                return True
+        return False
+
+    def _candidates(self, rel, module, level, names):
+        if level:
+            package = rel.split('/')[:-1]
+            if level > 1:
+                package = package[:-(level - 1)]
+            base = '.'.join(package + ([module] if module else []))
+        else:
+            base = module
+        result = [base] if base else []
+        # from package import submodule
+        result += ['{}.{}'.format(base, n) if base else n
+                   for n in names if n != '*']
+        # importing a.b.c also runs a and a.b
+        parts = base.split('.') if base else []
+        result += ['.'.join(parts[:i]) for i in range(1, len(parts))]
+        return result
+
+    def reachable(self, entries=ENTRY_POINTS):
+        """ Files the board needs to run the entry scripts
+            :returns:
+                A (files, builtin, missing) tuple of sets: project files to
+                upload, firmware modules and modules not found
+        """
+        todo = [e for e in entries if e in self.index.files]
+        files = set(todo)
+        builtin = set()
+        missing = set()
+        while todo:
+            rel = todo.pop()
+            for module, level, names in self.imports_of(rel):
+                candidates = self._candidates(rel, module, level, names)
+                for n, dotted in enumerate(candidates):
+                    target = self._project_module(dotted)
+                    if target:
+                        if target not in files:
+                            files.add(target)
+                            todo.append(target)
+                    elif n == 0 and not level:
+                        if self._stub_module(dotted):
+                            builtin.add(dotted)
+                        else:
+                            missing.add(dotted)
+        for rel in list(self._imports):
+            if rel not in self.index.files:
+                del self._imports[rel]
+        return files, builtin, missing
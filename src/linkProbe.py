@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Serial link rate probe.
+
+The board REPL UART is switched to the next faster rate by the SWITCH
+script: it prints ``#BAUD``, changes rate and waits for a ``!`` from the
+host at the new rate. Without it the board goes back to the old rate and
+prints ``#FAIL``, so a rate the adapter can not do never loses the board.
+Each rate that switches is checked with an echo of a known payload, which
+also measures the effective throughput. The board returns to its default
+rate on reset unless boot.py sets another one.
+"""
+import threading
+import time
+
+import pyqode.qt.QtCore as QtCore
+
+from replSession import output_text
+
+BAUD_RATES = (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+DEFAULT_BAUD = 115200
+
+#: Seconds the board waits before switching, and the host waits for #LINK
+SETTLE = 0.2
+CONFIRM = 1.0
+
+#: Seconds an echo round trip or a switch may take before the rate is
+#: given up
+ECHO_TIMEOUT = 5
+
+SWITCH = '''
+import pyb
+def _baud(new, old):
+    u = pyb.repl_uart()
+    if u is None:
+        print('#NOUART')
+        return
+    print('#BAUD', new)
+    pyb.delay(100)
+    u.init(new)
+    t = pyb.millis()
+    while pyb.elapsed_millis(t) < 2000:
+        if u.any() and u.read(1) == b'!':
+            print('#LINK', new)
+            return
+    u.init(old)
+    print('#FAIL', new)
+_baud({new}, {old})
+del _baud
+'''
+
+PAYLOAD = ''.join(chr(32 + (i * 7) % 95) for i in range(2048))
+
+ECHO = 'print("#P" + {!r})'.format(PAYLOAD)
+
+
+def switch_script(new, old):
+    return SWITCH.format(new=new, old=old)
+
+
+def echo_ok(raw):
+    text = output_text(raw)
+    return '#P' + PAYLOAD in text
+
+
+def settings_key(port, name):
+    """ QSettings key of a per port value, '/' would nest groups """
+    return 'ports/{}/{}'.format(port.strip('/').replace('/', '_'), name)
+
+
+class BaudWatcher(object):
+    '''
+    Terminal interceptor following the SWITCH script: changes the host rate
+    with the board's, confirms it, and goes back if the board never answers
+    '''
+    def __init__(self, term, old, new):
+        self._term = term
+        self._old = old
+        self._new = new
+        self._buf = b''
+        self._timer = None
+        self._done = False
+
+    def __call__(self, text):
+        if self._done:
+            return True
+        self._buf += text
+        if self._timer is None:
+            if b'#NOUART' in self._buf or b'#FAIL' in self._buf:
+                return True
+            found = self._buf.find(b'#BAUD')
+            if found >= 0 and b'\n' in self._buf[found:]:
+                time.sleep(SETTLE)
+                self._term.setBaud(self._new)
+                self._buf = b''
+                self._timer = threading.Timer(CONFIRM, self._revert)
+                self._timer.start()
+                self._term.write(b'!')
+            return False
+        if b'#LINK' in self._buf:
+            self._timer.cancel()
+            return True
+        return False
+
+    def _revert(self):
+        # the board did not hear us, it goes back to the old rate too
+        self._done = True
+        self._term.setBaud(self._old)
+
+
+class LinkProbe(QtCore.QObject):
+    '''
+    Steps the link through the faster BAUD_RATES and keeps the fastest one
+    passing an echo round trip. target_exec(script, continuation) runs a
+    script on the board, as MainWindow._targetExec.
+    '''
+    finished = QtCore.Signal(int, float)
+    _switchDone = QtCore.Signal(object)
+    _echoDone = QtCore.Signal(object)
+
+    def __init__(self, term, target_exec, rate, parent=None):
+        super(LinkProbe, self).__init__(parent)
+        self.term = term
+        self.target_exec = target_exec
+        self.rate = rate
+        self.throughput = 0.0
+        self._trying = None
+        # (new, old) rates while a switch waits for its answer
+        self._switching = None
+        self._start = 0
+        self._timeout = QtCore.QTimer(self)
+        self._timeout.setSingleShot(True)
+        self._timeout.setInterval(ECHO_TIMEOUT * 1000)
+        self._timeout.timeout.connect(self._expired)
+        self._switchDone.connect(self._switched)
+        self._echoDone.connect(self._echoed)
+
+    def start(self):
+        # measure the current rate first
+        self._echo()
+
+    def _echo(self):
+        self._start = time.time()
+        self._timeout.start()
+        self.target_exec(ECHO, self._echoDone.emit)
+
+    def _echoed(self, raw):
+        if not self._timeout.isActive():
+            return
+        self._timeout.stop()
+        elapsed = time.time() - self._start
+        if not echo_ok(raw):
+            self._fallback()
+            return
+        if self._trying:
+            self.rate = self._trying
+            self._trying = None
+        self.throughput = (len(ECHO) + len(raw)) / elapsed
+        print(('Link probe: ', self.rate, 'baud', int(self.throughput),
+               'bytes/s'))
+        faster = [r for r in BAUD_RATES if r > self.rate]
+        if faster:
+            self._switch(faster[0], self.rate)
+        else:
+            self.finished.emit(self.rate, self.throughput)
+
+    def _expired(self):
+        if self._switching:
+            new, old = self._switching
+            self._switching = None
+            print(('Link probe: no answer switching to ', new))
+            # the board goes back to old when it does not hear from us
+            self.term.setBaud(old)
+            self._trying = None
+            self.rate = old
+        else:
+            print(('Link probe: no echo at ', self._trying or self.rate))
+        self._fallback()
+
+    def _fallback(self):
+        if self._trying:
+            # the rate switched but does not carry data, go back
+            tried, self._trying = self._trying, None
+            self._switch(self.rate, tried, last=True)
+        else:
+            self.finished.emit(self.rate, self.throughput)
+
+    def _switch(self, new, old, last=False):
+        self._trying = None if last else new
+        self._switching = (new, old)
+        self._timeout.start()
+        self.term.remoteExec(b'', BaudWatcher(self.term, old, new),
+                             ECHO_TIMEOUT)
+        self.target_exec(switch_script(new, old), self._switchDone.emit)
+
+    def _switched(self, raw):
+        if not self._timeout.isActive():
+            return
+        self._timeout.stop()
+        self._switching = None
+        if self._trying and b'#LINK' in raw:
+            self._echo()
+        else:
+            self._trying = None
+            self.finished.emit(self.rate, self.throughput)
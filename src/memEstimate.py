@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static RAM and code size estimator for MicroPython scripts.
+
+The script is compiled on the host, so numbers are estimates: bytecode size
+is taken from the instruction count, constant strings and large literals
+(list/tuple/dict/set displays, [x] * N, bytearray(N), bytes(N)) are sized
+with MicroPython object layouts. Results are checked against a board
+profile and the allocations likely to raise MemoryError are flagged.
+
+Board profiles can be added or changed in ~/.uPyIDE/boards.json::
+
+    {"my-board": {"name": "My board", "heap": 65536, "word_size": 4}}
+"""
+import ast
+import collections
+import dis
+import hashlib
+import json
+import os
+import types
+
+from myDef import cache_dir
+
+BoardProfile = collections.namedtuple('BoardProfile', 'name heap word_size')
+
+#: Built in profiles, the heap is the free gc heap after a soft reset
+PROFILES = {
+    'edu-ciaa': BoardProfile('EDU-CIAA', 40 * 1024, 4),
+    'pyboard': BoardProfile('PyBoard v1.1', 100 * 1024, 4),
+}
+DEFAULT_PROFILE = 'edu-ciaa'
+
+#: Average bytes per MicroPython bytecode instruction
+BYTES_PER_OP = 2
+#: Literals with at least this many elements are reported
+LARGE_LITERAL = 32
+#: Whole module over this fraction of the heap is flagged
+MODULE_RISK = 0.5
+#: Single allocation over this fraction of the heap is flagged
+ALLOCATION_RISK = 0.25
+
+Scope = collections.namedtuple('Scope', 'name line bytecode strings')
+Literal = collections.namedtuple('Literal', 'scope line description size')
+
+
+class Report(object):
+    def __init__(self, profile):
+        self.profile = profile
+        self.scopes = []
+        self.literals = []
+        self.risks = []
+        self.error = None
+
+    @property
+    def bytecode(self):
+        return sum(s.bytecode for s in self.scopes)
+
+    @property
+    def strings(self):
+        return sum(s.strings for s in self.scopes)
+
+    @property
+    def allocations(self):
+        return sum(l.size for l in self.literals)
+
+    @property
+    def total(self):
+        return self.bytecode + self.strings + self.allocations
+
+
+def load_profiles():
+    profiles = dict(PROFILES)
+    try:
+        with open(os.path.join(cache_dir(), 'boards.json')) as f:
+            for key, value in json.load(f).items():
+                profiles[key] = BoardProfile(value.get('name', key),
+                                             int(value['heap']),
+                                             int(value.get('word_size', 4)))
+    except (IOError, ValueError, KeyError, AttributeError) as e:
+        if not isinstance(e, IOError):
+            print(('boards.json: ', e))
+    return profiles
+
+
+def _str_size(value, word):
+    # object header (type, hash, length, data pointer) plus the data
+    return 4 * word + len(value)
+
+
+def _code_objects(code):
+    yield code
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            for sub in _code_objects(const):
+                yield sub
+
+
+def _scopes(code, word):
+    for co in _code_objects(code):
+        ops = sum(1 for i in dis.get_instructions(co))
+        strings = sum(_str_size(c, word) for c in co.co_consts
+                      if isinstance(c, (str, bytes)) and len(c) > 8)
+        name = getattr(co, 'co_qualname', co.co_name)
+        yield Scope(name, co.co_firstlineno, ops * BYTES_PER_OP, strings)
+
+
+def _const_int(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, int):
+        return node.value
+    return None
+
+
+class _LiteralFinder(ast.NodeVisitor):
+    def __init__(self, word):
+        self.word = word
+        self.scope = ['<module>']
+        self.found = []
+
+    def _scoped(self, node):
+        self.scope.append(node.name)
+        self.generic_visit(node)
+        self.scope.pop()
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = _scoped
+
+    def _add(self, node, description, size):
+        self.found.append(Literal('.'.join(self.scope), node.lineno,
+                                  description, size))
+
+    def _display(self, node, kind, count, slots):
+        if count >= LARGE_LITERAL:
+            self._add(node, '{} of {} items'.format(kind, count),
+                      (4 + slots) * self.word)
+        self.generic_visit(node)
+
+    def visit_List(self, node):
+        self._display(node, 'list', len(node.elts), len(node.elts))
+
+    def visit_Tuple(self, node):
+        self._display(node, 'tuple', len(node.elts), len(node.elts))
+
+    def visit_Set(self, node):
+        self._display(node, 'set', len(node.elts), 2 * len(node.elts))
+
+    def visit_Dict(self, node):
+        # open addressing table, kept at most ~2/3 full
+        self._display(node, 'dict', len(node.keys), 3 * len(node.keys))
+
+    def visit_BinOp(self, node):
+        if isinstance(node.op, ast.Mult):
+            for seq, times in ((node.left, node.right),
+                               (node.right, node.left)):
+                count = _const_int(times)
+                if count is None:
+                    continue
+                if isinstance(seq, (ast.List, ast.Tuple)):
+                    n = count * len(seq.elts)
+                    self._add(node, 'sequence repeated to {} items'.format(n),
+                              (4 + n) * self.word)
+                elif isinstance(seq, ast.Constant) and \
+                        isinstance(seq.value, (str, bytes)):
+                    n = count * len(seq.value)
+                    self._add(node, 'string repeated to {} bytes'.format(n),
+                              _str_size(' ' * n, self.word))
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Name) and \
+                node.func.id in ('bytearray', 'bytes') and node.args:
+            n = _const_int(node.args[0])
+            if n is not None:
+                self._add(node, '{}({})'.format(node.func.id, n),
+                          _str_size(' ' * n, self.word))
+        self.generic_visit(node)
+
+
+def estimate(source, profile, filename='<editor>'):
+    report = Report(profile)
+    try:
+        # the MicroPython lexer accepts mixed tabs, stops every 8 columns
+        tree = ast.parse(source.expandtabs(8), filename)
+        code = compile(tree, filename, 'exec')
+    except (SyntaxError, ValueError) as e:
+        report.error = str(e)
+        return report
+    word = profile.word_size
+    report.scopes = list(_scopes(code, word))
+    finder = _LiteralFinder(word)
+    finder.visit(tree)
+    report.literals = finder.found
+    for literal in report.literals:
+        if literal.size > profile.heap * ALLOCATION_RISK:
+            report.risks.append(
+                (literal.line, '{} in {} needs ~{} bytes in one block'.format(
+                    literal.description, literal.scope, literal.size)))
+    if report.total > profile.heap * MODULE_RISK:
+        report.risks.append(
+            (1, 'module needs ~{} of {} heap bytes to load and run'.format(
+                report.total, profile.heap)))
+    return report
+
+
+_cache = {}
+
+
+def _key(source, profile):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest(), profile
+
+
+def estimate_cached(source, profile, filename='<editor>'):
+    """ estimate() memoized on the source hash and the board profile """
+    key = _key(source, profile)
+    # may run on several threads, the cache is only read or set at once
+    report = _cache.get(key)
+    if report is None:
+        if len(_cache) > 64:
+            _cache.clear()
+        report = _cache[key] = estimate(source, profile, filename)
+    return report
+
+
+def cached(source, profile):
+    """ The report estimate_cached() keeps for source, without estimating
+        :returns:
+            The report, None if source was not estimated yet
+    """
+    return _cache.get(_key(source, profile))
+
+
+def format_report(report):
+    if report.error:
+        return 'Can not analyse: {}'.format(report.error)
+    lines = ['Board: {} ({} heap bytes)'.format(report.profile.name,
+                                                report.profile.heap),
+             'Bytecode ~{} bytes, strings ~{} bytes, '
+             'large literals ~{} bytes'.format(report.bytecode,
+                                               report.strings,
+                                               report.allocations),
+             '']
+    for scope in sorted(report.scopes, key=lambda s: s.line):
+        lines.append('{:>5}  {:<30} {:>6} B code {:>6} B str'.format(
+            scope.line, scope.name, scope.bytecode, scope.strings))
+    if report.literals:
+        lines.append('')
+        for literal in report.literals:
+            lines.append('{:>5}  {} ({}) ~{} B'.format(
+                literal.line, literal.description, literal.scope,
+                literal.size))
+    if report.risks:
+        lines.append('')
+        lines.append('Possible MemoryError:')
+        for line, message in report.risks:
+            lines.append('  line {}: {}'.format(line, message))
+    return '\n'.join(lines)
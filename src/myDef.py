@@ -5,10 +5,37 @@ Created on Tue Jul 25 00:22:16 2017
 
 @author: coolshou
 """
+import functools
 import pyqode_i18n
 import locale
+import os
 
+# resolved once, the locale does not change while the IDE runs
+LANG, ENCODING = locale.getdefaultlocale()
+
+
+@functools.lru_cache(maxsize=None)
 def i18n(s):
-    lang, encode = locale.getdefaultlocale()
-    return pyqode_i18n.tr(s, lang=lang)
+    return pyqode_i18n.tr(s, lang=LANG)
+
+
+def subsequence_score(query, text):
+    """ Gaps between the characters of query found in order in text, None
+        if text does not contain them all. Lower is a better fuzzy match.
+    """
+    pos = -1
+    gaps = 0
+    for c in query:
+        found = text.find(c, pos + 1)
+        if found < 0:
+            return None
+        gaps += found - pos - 1
+        pos = found
+    return gaps
+
 
+def cache_dir(*parts):
+    path = os.path.join(os.path.expanduser('~'), '.uPyIDE', *parts)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    return path
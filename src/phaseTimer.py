@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup phase timing, kept apart from startupProfile.py so the IDE does not
+import its command line tooling when it starts.
+"""
+import time
+
+
+class PhaseTimer(object):
+    '''
+    Records the duration of each named startup phase
+    '''
+    def __init__(self):
+        self._start = self._last = time.perf_counter()
+        self.phases = []
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self._start
+
+    def report(self):
+        lines = ['Startup timing:']
+        for phase, elapsed in self.phases:
+            lines.append('  {:<24} {:8.1f} ms'.format(phase, elapsed * 1000))
+        lines.append('  {:<24} {:8.1f} ms'.format('total',
+                                                 self.total() * 1000))
+        return '\n'.join(lines)
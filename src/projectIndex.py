@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Project file index.
+
+A project is a root directory. Its files are kept in an index with their
+mtime, size and sha1, persisted under ~/.uPyIDE/projects. Opening a project
+only stats the tree and hashes files that changed; after that the index is
+kept current one file or directory at a time (see update_file and
+update_dir), driven by file system notifications.
+"""
+import hashlib
+import json
+import os
+
+from myDef import cache_dir, subsequence_score
+
+INDEX_VERSION = 1
+
+IGNORED_DIRS = ('__pycache__', '.git', '.hg', '.svn')
+IGNORED_SUFFIXES = ('.pyc', '.pyo', '~', '.swp')
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def ignored(name):
+    return name in IGNORED_DIRS or name.endswith(IGNORED_SUFFIXES)
+
+
+class ProjectIndex(object):
+    '''
+    Index of the files under a project root, keyed by '/' separated path
+    relative to the root
+    '''
+    def __init__(self, root, index_file=None):
+        self.root = os.path.abspath(root)
+        if index_file is None:
+            key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+            index_file = os.path.join(cache_dir('projects'),
+                                      '{}.json'.format(key))
+        self.index_file = index_file
+        self.files = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION and \
+                data.get('root') == self.root:
+            self.files = data.get('files', {})
+
+    def save(self):
+        with open(self.index_file, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'root': self.root,
+                       'files': self.files}, f)
+
+    def relpath(self, path):
+        return os.path.relpath(os.path.abspath(path),
+                               self.root).replace(os.sep, '/')
+
+    def abspath(self, rel):
+        return os.path.join(self.root, *rel.split('/'))
+
+    def _walk(self, top):
+        for dirpath, dirnames, filenames in os.walk(top):
+            dirnames[:] = [d for d in dirnames if not ignored(d)]
+            yield dirpath, filenames
+
+    def directories(self):
+        """ Directories of the tree, to be watched for changes """
+        return [dirpath for dirpath, filenames in self._walk(self.root)]
+
+    def update_file(self, path):
+        """ Bring one file up to date
+            :returns:
+                True if the index changed
+        """
+        rel = self.relpath(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self.files.pop(rel, None) is not None
+        known = self.files.get(rel)
+        if known and known['mtime'] == st.st_mtime and \
+                known['size'] == st.st_size:
+            return False
+        try:
+            digest = file_hash(path)
+        except IOError:
+            return False
+        self.files[rel] = {'mtime': st.st_mtime, 'size': st.st_size,
+                           'sha1': digest}
+        return True
+
+    def update_dir(self, path):
+        """ Bring the entries of one directory up to date, new directories
+            are indexed recursively
+            :returns:
+                A (changed, new_directories) tuple
+        """
+        changed = False
+        new_dirs = []
+        rel_dir = self.relpath(path)
+        prefix = '' if rel_dir == '.' else rel_dir + '/'
+        try:
+            names = [n for n in os.listdir(path) if not ignored(n)]
+        except OSError:
+            names = []
+        present = set()
+        for name in names:
+            full = os.path.join(path, name)
+            if os.path.isdir(full):
+                if not any(rel.startswith(prefix + name + '/')
+                           for rel in self.files):
+                    for dirpath, filenames in self._walk(full):
+                        new_dirs.append(dirpath)
+                        for f in filenames:
+                            if not ignored(f):
+                                changed |= self.update_file(
+                                    os.path.join(dirpath, f))
+                present.add(prefix + name + '/')
+            else:
+                present.add(prefix + name)
+                changed |= self.update_file(full)
+        for rel in list(self.files):
+            if not rel.startswith(prefix):
+                continue
+            rest = rel[len(prefix):]
+            head = rest.split('/')[0]
+            key = prefix + head + ('/' if '/' in rest else '')
+            if key not in present:
+                del self.files[rel]
+                changed = True
+        return changed, new_dirs
+
+    def refresh(self):
+        """ Stat the whole tree, only changed files are hashed again
+            :returns:
+                True if the index changed
+        """
+        changed = False
+        seen = set()
+        for dirpath, filenames in self._walk(self.root):
+            for name in filenames:
+                if ignored(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                seen.add(self.relpath(path))
+                changed |= self.update_file(path)
+        for rel in set(self.files) - seen:
+            del self.files[rel]
+            changed = True
+        return changed
+
+    def quick_open(self, query, limit=50):
+        """ Relative paths fuzzy matching query, best first """
+        query = query.strip().lower().replace(' ', '')
+        if not query:
+            return sorted(self.files)[:limit]
+        ranked = []
+        for rel in self.files:
+            name = rel.lower()
+            base = name.rsplit('/', 1)[-1]
+            if query in base:
+                score = (0, len(base))
+            else:
+                gaps = subsequence_score(query, name)
+                if gaps is None:
+                    continue
+                score = (1, gaps)
+            ranked.append((score, rel))
+        ranked.sort()
+        return [rel for score, rel in ranked[:limit]]
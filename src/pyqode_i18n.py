@@ -19,6 +19,7 @@ _dict = {
         "Cut": "Cortar",
         "Copy": "Copiar",
         "Paste": "Pegar",
+        "Cancel": "Cancelar",
         "Duplicate line": "Duplicar Linea",
         "Delete": "Borrar",
         "Indent": "Identar",
@@ -52,7 +53,44 @@ _dict = {
         "Serial Port:": "Puerto Serial:",
         "NewFile.py (%d)": "Nuevo.py (%d)",
         "Remote Name": "Nombre Remoto",
-        "Select Serial Port": "Seleccionar Puerto Serie"
+        "Select Serial Port": "Seleccionar Puerto Serie",
+        "Generate stubs": "Generar stubs",
+        "Probe link": "Probar enlace",
+        "Baud rate": "Velocidad en baudios",
+        "Fastest reliable rate:": "Velocidad confiable más rápida:",
+        "Throughput:": "Rendimiento:",
+        "Used until the board resets, unless boot.py sets it":
+            "Se usa hasta que la placa se reinicie, salvo que boot.py la fije",
+        "Filter": "Filtrar",
+        "Memory": "Memoria",
+        "Board": "Placa",
+        "Estimating memory...": "Estimando memoria...",
+        "The board can not check the uploaded lines":
+            "La placa no puede verificar las líneas enviadas",
+        "Project": "Proyecto",
+        "Unsaved changes were recovered after a crash":
+            "Se recuperaron cambios sin guardar tras un cierre inesperado",
+        "Restore them?": "¿Restaurarlos?",
+        "Deploy": "Desplegar",
+        "Reload module": "Recargar módulo",
+        "Reload failed:": "Falló la recarga:",
+        "Pasting": "Pegando",
+        "The board did not answer": "La placa no respondió",
+        "Run cell": "Ejecutar celda",
+        "Run the selection or the # %% cell at the cursor":
+            "Ejecuta la selección o la celda # %% del cursor",
+        "Cell output": "Salida de celdas",
+        "Files corrupted during upload:": "Archivos dañados durante la carga:",
+        "Upload interrupted, upload again to resume:": "Carga interrumpida, vuelva a cargar para continuar:",
+        "No main.py or boot.py in project": "No hay main.py ni boot.py en el proyecto",
+        "Open Project": "Abrir Proyecto",
+        "Quick open": "Apertura rapida",
+        "Possible MemoryError on the board":
+            "Posible MemoryError en la placa",
+        "Script should fit on the board": "El script deberia entrar en la placa",
+        "Continue anyway?": "¿Continuar de todos modos?",
+        "Stubs saved, used by new editors:":
+            "Stubs guardados, se usan en los nuevos editores:"
     },
     "zh_TW": {
         "Edu CIAA MicroPython": "Edu CIAA MicroPython",
@@ -72,6 +110,7 @@ _dict = {
         "Cut": "剪下",
         "Copy": "複製",
         "Paste": "貼上",
+        "Cancel": "取消",
         "Duplicate line": "複製此行",
         "Delete": "刪除",
         "Indent": "縮排",
@@ -109,13 +148,65 @@ _dict = {
         "Device files": "裝置的檔案",
         "Refresh": "重新整理",
         "Device": "裝置",
-        "Download to Device": "上傳到裝置"
+        "Download to Device": "上傳到裝置",
+        "Generate stubs": "產生 stubs",
+        "Probe link": "測試連線",
+        "Baud rate": "鮑率",
+        "Fastest reliable rate:": "最快可靠速率:",
+        "Throughput:": "傳輸量:",
+        "Used until the board resets, unless boot.py sets it":
+            "在板子重置前使用，除非 boot.py 設定此速率",
+        "Filter": "篩選",
+        "Memory": "記憶體",
+        "Board": "開發板",
+        "Estimating memory...": "正在估算記憶體...",
+        "The board can not check the uploaded lines":
+            "板子無法檢查上傳的資料行",
+        "Project": "專案",
+        "Unsaved changes were recovered after a crash": "已從當機中復原未儲存的修改",
+        "Restore them?": "要還原嗎?",
+        "Deploy": "部署",
+        "Reload module": "重新載入模組",
+        "Reload failed:": "重新載入失敗:",
+        "Pasting": "貼上中",
+        "The board did not answer": "開發板沒有回應",
+        "Run cell": "執行儲存格",
+        "Run the selection or the # %% cell at the cursor":
+            "執行選取範圍或游標所在的 # %% 儲存格",
+        "Cell output": "儲存格輸出",
+        "Files corrupted during upload:": "上傳時損壞的檔案:",
+        "Upload interrupted, upload again to resume:": "上傳中斷，再次上傳即可繼續:",
+        "No main.py or boot.py in project": "專案中沒有 main.py 或 boot.py",
+        "Open Project": "開啟專案",
+        "Quick open": "快速開啟",
+        "Possible MemoryError on the board": "裝置上可能發生 MemoryError",
+        "Script should fit on the board": "程式應該可以放入裝置",
+        "Continue anyway?": "仍要繼續?",
+        "Stubs saved, used by new editors:": "Stubs 已儲存, 新的編輯器會使用:"
     }
 }
 
 
+_catalogs = {}
+
+
+def catalog(lang):
+    """ Flat translation table for lang, built once per language. Regional
+        variants fall back to the base language (es_AR uses es).
+    """
+    try:
+        return _catalogs[lang]
+    except KeyError:
+        table = {}
+        if lang:
+            table.update(_dict.get(lang.split('_')[0], {}))
+            table.update(_dict.get(lang, {}))
+        _catalogs[lang] = table
+        return table
+
+
 def tr(text, lang="es"):
-    if lang in _dict and text in _dict[lang].keys():
-        return _dict[lang][text]
-    else:
+    translated = catalog(lang).get(text)
+    if translated is None:
         return "*{}".format(text)
+    return translated
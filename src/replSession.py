@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Work in the live namespace of the board REPL.
+
+Scripts run through the raw REPL share the globals of the interactive REPL,
+so what they define stays there between runs. reload_script() swaps one
+module for its new version: it is dropped from sys.modules, imported again,
+and the names bound to the old module in the REPL globals are bound to the
+new one.
+
+Editor buffers can also be run a cell at a time, cells are delimited by
+``# %%`` lines as in Jupyter, so setup code runs once and later cells use
+what it left in the namespace.
+"""
+import posixpath
+import re
+import textwrap
+
+from importGraph import SYS_PATH
+
+CELL_MARK = re.compile(r'^\s*#\s*%%')
+
+RELOAD = '''
+import sys
+def _reload(name):
+    old = sys.modules.pop(name, None)
+    __import__(name)
+    new = sys.modules[name]
+    g = globals()
+    top = name.split('.')[0]
+    g[top] = sys.modules[top]
+    for k in list(g):
+        if old is not None and g[k] is old:
+            g[k] = new
+    print('#RELOADED', name)
+_reload({name!r})
+del _reload
+'''
+
+
+def module_name(remote_path, root='/flash'):
+    """ Dotted module name of a remote .py file, as the board imports it
+        from its sys.path, None if it is not under root or not a module
+    """
+    rel = posixpath.relpath(remote_path, root)
+    if rel.startswith('..') or not rel.endswith('.py'):
+        return None
+    for prefix in SYS_PATH:
+        if prefix and rel.startswith(prefix):
+            rel = rel[len(prefix):]
+            break
+    rel = rel[:-3]
+    if rel.endswith('/__init__'):
+        rel = rel[:-9]
+    return rel.replace('/', '.')
+
+
+def reload_script(name):
+    return RELOAD.format(name=name)
+
+
+def output_text(raw):
+    """ Text of the board output _targetExec hands to its continuation """
+    return raw.decode(errors='ignore') if isinstance(raw, bytes) else raw
+
+
+def reloaded(raw):
+    """ True if the reload script output reports success """
+    text = output_text(raw)
+    return '#RELOADED ' in text
+
+
+def cell_ranges(lines):
+    """ (first, end) line ranges of the cells of a list of lines """
+    starts = [0] + [n for n, line in enumerate(lines)
+                    if n and CELL_MARK.match(line)]
+    return list(zip(starts, starts[1:] + [len(lines)]))
+
+
+def cell_at(text, line):
+    """ Cell of text containing a line
+        :returns:
+            A (first line, source) tuple
+    """
+    lines = text.split('\n')
+    for first, end in cell_ranges(lines):
+        if first <= line < end:
+            return first, '\n'.join(lines[first:end])
+    return line, ''
+
+
+def runnable(source):
+    """ Source of a cell or selection ready for the raw REPL """
+    return textwrap.dedent(source).strip('\n')
+
+
+def split_output(raw):
+    """ Output of a script run by MainWindow._targetExec
+        :returns:
+            A (stdout, stderr) tuple of text
+    """
+    text = output_text(raw)
+    if text.startswith('OK'):
+        text = text[2:]
+    out, _, err = text.partition('\x04')
+    # the screen clear _targetExec prints first
+    if out.startswith('\x1bc'):
+        out = out[2:].lstrip('\r\n')
+    err = err[:-2] if err.endswith('\x04>') else err
+    return out.replace('\r\n', '\n'), err.replace('\r\n', '\n')
@@ -34,11 +34,13 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--syspath', nargs='*')
     args = parser.parse_args()
 
-    # add user paths to sys.path
+    # add user paths to sys.path, first so the firmware stubs shadow the
+    # standard library modules of the same name (os, time, json...).
+    # Modules compiled into the interpreter (sys, time on some platforms)
+    # are still found first by jedi.
     if args.syspath:
-        for path in args.syspath:
-            print(('append path %s to sys.path' % path))
-            sys.path.append(path)
+        print(('prepend paths %s to sys.path' % args.syspath))
+        sys.path[0:0] = args.syspath
 
     from pyqode.core import backend
     from pyqode.python.backend.workers import JediCompletionProvider
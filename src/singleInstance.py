@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single instance channel.
+
+The running IDE listens on a localhost port published, with a random token,
+in ~/.uPyIDE/instance. A later launch calls forward() before loading Qt or
+pyqode: if an IDE answers, the file arguments are handed over and the new
+process can exit at once. Only the standard library is used here so the
+forwarding launch stays cheap.
+"""
+import binascii
+import json
+import os
+import socket
+
+from myDef import cache_dir
+
+TIMEOUT = 0.5
+
+
+def _instance_file():
+    return os.path.join(cache_dir(), 'instance')
+
+
+def publish(port):
+    """ Record the port of this instance, returns the token to expect """
+    token = binascii.hexlify(os.urandom(16)).decode()
+    path = _instance_file()
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'port': port, 'token': token, 'pid': os.getpid()}, f)
+    return token
+
+
+def unpublish():
+    try:
+        with open(_instance_file()) as f:
+            if json.load(f).get('pid') != os.getpid():
+                return
+        os.remove(_instance_file())
+    except (IOError, OSError, ValueError):
+        pass
+
+
+def encode(token, files):
+    return json.dumps({'token': token, 'files': files}).encode() + b'\n'
+
+
+def decode(line):
+    """ Returns (token, files) from a request line """
+    message = json.loads(line.decode())
+    return message.get('token'), list(message.get('files', []))
+
+
+def forward(files):
+    """ Hand files to a running instance
+        :returns:
+            True if an instance accepted them
+    """
+    try:
+        with open(_instance_file()) as f:
+            info = json.load(f)
+        s = socket.create_connection(('127.0.0.1', info['port']), TIMEOUT)
+    except (IOError, OSError, ValueError, KeyError):
+        return False
+    try:
+        s.settimeout(TIMEOUT)
+        s.sendall(encode(info['token'],
+                         [os.path.abspath(name) for name in files]))
+        return s.makefile('rb').readline().strip() == b'ok'
+    except (IOError, OSError):
+        return False
+    finally:
+        s.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Snipplet library index.
+
+Keeps the name and search words of every snipplet found in a set of
+directories (*.xml collections and *.py files with a "# Description:" header)
+in a json index. Only files whose mtime or size changed are parsed again and
+snipplet bodies are read when they are needed.
+"""
+import glob
+import json
+import os
+import re
+
+from myDef import subsequence_score
+
+INDEX_VERSION = 1
+
+_DESCRIPTION = re.compile(r'^# Description: (.*)[\r\n]*')
+_WORD = re.compile(r'[A-Za-z_][A-Za-z0-9_]+')
+
+
+def _words(text):
+    return sorted(set(w.lower() for w in _WORD.findall(text or '')))
+
+
+def _parse_xml(path):
+    import xml.etree.ElementTree as ElementTree
+    root = ElementTree.parse(path).getroot()
+    return [(child.attrib["name"], child.text or '') for child in root]
+
+
+def _parse_code(path):
+    with open(path) as f:
+        s = f.read()
+    description = ''.join(re.findall(_DESCRIPTION, s))
+    contents = re.sub(_DESCRIPTION, '', s)
+    if description and contents:
+        return description, contents
+    return None
+
+
+class SnippletIndex(object):
+    '''
+    Persisted metadata index of the snipplet files in some directories
+    '''
+    def __init__(self, directories, index_file):
+        self.directories = directories
+        self.index_file = index_file
+        self.entries = []
+        self._files = {}
+        self._bodies = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+        if data.get('version') == INDEX_VERSION:
+            self._files = data.get('files', {})
+            self._collect()
+
+    def _save(self):
+        with open(self.index_file, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'files': self._files}, f)
+
+    def _collect(self):
+        self.entries = []
+        for path in sorted(self._files):
+            for n, entry in enumerate(self._files[path]['entries']):
+                self.entries.append(dict(entry, file=path, key=n))
+
+    def _sources(self):
+        for directory in self.directories:
+            for pattern in ('*.xml', '*.py'):
+                for path in glob.glob(os.path.join(directory, pattern)):
+                    yield os.path.abspath(path)
+
+    def _index_file(self, path):
+        if path.endswith('.xml'):
+            found = _parse_xml(path)
+        else:
+            found = _parse_code(path)
+            found = [found] if found else []
+        return [{'name': name, 'words': _words(name + ' ' + body)}
+                for name, body in found]
+
+    def refresh(self):
+        """ Reindex new and changed files
+            :returns:
+                True if the index changed
+        """
+        changed = False
+        seen = set()
+        for path in self._sources():
+            seen.add(path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stamp = [st.st_mtime, st.st_size]
+            known = self._files.get(path)
+            if known and known['stamp'] == stamp:
+                continue
+            try:
+                entries = self._index_file(path)
+            except Exception as e:
+                print(('snipplet index: ', path, e))
+                entries = []
+            self._files[path] = {'stamp': stamp, 'entries': entries}
+            self._bodies.pop(path, None)
+            changed = True
+        for path in set(self._files) - seen:
+            del self._files[path]
+            self._bodies.pop(path, None)
+            changed = True
+        if changed:
+            self._collect()
+            self._save()
+        return changed
+
+    def body(self, entry):
+        """ Contents of a snipplet, read from its file on first use """
+        path = entry['file']
+        if path not in self._bodies:
+            if path.endswith('.xml'):
+                self._bodies[path] = [body for name, body in _parse_xml(path)]
+            else:
+                found = _parse_code(path)
+                self._bodies[path] = [found[1] if found else '']
+        bodies = self._bodies[path]
+        return bodies[entry['key']] if entry['key'] < len(bodies) else ''
+
+    def search(self, text):
+        """ Entries fuzzy matching text, best first
+
+            Names containing the text rank first, then names containing its
+            characters in order, then snipplets whose words start with every
+            word of the text.
+        """
+        query = text.strip().lower()
+        if not query:
+            return list(self.entries)
+        terms = [w.lower() for w in _WORD.findall(query)] or [query]
+        ranked = []
+        for entry in self.entries:
+            name = entry['name'].lower()
+            if query in name:
+                score = (0, name.find(query))
+            else:
+                gaps = subsequence_score(query.replace(' ', ''), name)
+                if gaps is not None:
+                    score = (1, gaps)
+                elif all(any(w.startswith(t) for w in entry['words'])
+                         for t in terms):
+                    score = (2, 0)
+                else:
+                    continue
+            ranked.append((score, name, entry))
+        ranked.sort(key=lambda r: (r[0], r[1]))
+        return [entry for score, name, entry in ranked]
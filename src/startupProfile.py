@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup import profiling, the phase timer is in phaseTimer.py.
+
+Run as a script to profile the imports done when loading the IDE module and
+check them against a time budget::
+
+    python startupProfile.py [--budget MS] [--top N] [module]
+
+The exit status is 1 when the imports go over the budget.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+#: Import-time budget, in milliseconds, for loading the IDE module
+IMPORT_BUDGET_MS = 1500
+
+
+def import_profile(module='uPyIDE', interpreter=sys.executable):
+    """ Import a module in a fresh interpreter with -X importtime
+        :returns:
+            A list of (cumulative_ms, module) for the top level imports,
+            slowest first
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run(
+        [interpreter, '-X', 'importtime', '-c', 'import {}'.format(module)],
+        cwd=here, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        universal_newlines=True)
+    if proc.returncode != 0:
+        raise ImportError(proc.stderr.strip().splitlines()[-1])
+    result = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        # nested imports are indented below their importer
+        if name.startswith('  '):
+            continue
+        result.append((int(fields[1]) / 1000.0, name.strip()))
+    result.sort(reverse=True)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the import time of '
+                                     'the IDE against a budget')
+    parser.add_argument('module', nargs='?', default='uPyIDE')
+    parser.add_argument('--budget', type=float, default=IMPORT_BUDGET_MS,
+                        help='budget in milliseconds')
+    parser.add_argument('--top', type=int, default=15,
+                        help='number of slowest imports to list')
+    args = parser.parse_args()
+    profile = import_profile(args.module)
+    total = sum(elapsed for elapsed, name in profile)
+    for elapsed, name in profile[:args.top]:
+        print('{:8.1f} ms  {}'.format(elapsed, name))
+    print('{:8.1f} ms  total (budget {:.0f} ms)'.format(total, args.budget))
+    if total > args.budget:
+        print('Import time over budget')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
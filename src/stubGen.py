@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stub library generator.
+
+Walks the modules of a connected board through the raw REPL and writes
+python stubs for them, so completion and linting see the real firmware API.
+Stubs are cached under ~/.uPyIDE/stubs/<firmware> and the last generated set
+is remembered, so editors can use it without talking to the board again.
+"""
+import ast
+import keyword
+import os
+import re
+
+from myDef import cache_dir
+from replSession import output_text
+
+DEFAULT_MODULES = (
+    'pyb', 'machine', 'micropython', 'sys', 'gc', 'os', 'uos', 'time',
+    'utime', 'math', 'cmath', 'array', 'struct', 'ustruct', 'json', 'ujson',
+    'binascii', 'ubinascii', 'collections', 'ucollections', 'io', 'uio',
+    'select', 'uselect', 'hashlib', 'uhashlib', 'zlib', 'uzlib', 're', 'ure',
+    'heapq', 'uheapq', 'errno', 'uerrno', 'network', 'socket', 'usocket',
+)
+
+CALLABLE_TYPES = ('function', 'builtin_function_or_method', 'bound_method',
+                  'method', 'closure', 'generator', 'staticmethod',
+                  'classmethod')
+
+VALUE_TYPES = ('int', 'float', 'str', 'bool', 'NoneType', 'bytes')
+
+# Runs on the board. Everything is printed in one exec, one line per module,
+# so the heap never has to hold the whole result at once.
+_INTROSPECT = '''
+import sys
+def _stub_members(o, d):
+    r = []
+    for a in dir(o):
+        if a.startswith('__'):
+            continue
+        try:
+            v = getattr(o, a)
+        except Exception:
+            continue
+        t = type(v).__name__
+        s = None
+        c = None
+        if t == 'type' and d:
+            c = _stub_members(v, d - 1)
+        elif t in {values!r}:
+            s = repr(v)
+        r.append((a, t, s, c))
+    return r
+try:
+    import uos as _stub_os
+except ImportError:
+    import os as _stub_os
+try:
+    _stub_u = _stub_os.uname()
+    print('#FW', repr((sys.implementation.name,
+        '.'.join([str(x) for x in sys.implementation.version]),
+        _stub_u.release, _stub_u.machine)))
+except Exception:
+    print('#FW', repr((sys.platform, sys.version, '', '')))
+for _stub_n in {modules!r}:
+    try:
+        _stub_m = __import__(_stub_n)
+    except ImportError:
+        continue
+    print('#STUB', repr((_stub_n, _stub_members(_stub_m, 1))))
+del _stub_members, _stub_os, _stub_n
+'''
+
+
+def introspect_script(modules=DEFAULT_MODULES):
+    return _INTROSPECT.format(modules=tuple(modules), values=VALUE_TYPES)
+
+
+def parse_result(raw):
+    """ Parse the board output of introspect_script
+        :returns:
+            A (firmware, modules) tuple, firmware is a tuple of strings and
+            modules a dict of module name to member list
+    """
+    text = output_text(raw)
+    firmware = None
+    modules = {}
+    for line in re.split(r'[\r\n]+', text):
+        if line.startswith('#FW '):
+            firmware = ast.literal_eval(line[4:])
+        elif line.startswith('#STUB '):
+            name, members = ast.literal_eval(line[6:])
+            modules[name] = members
+    return firmware, modules
+
+
+def firmware_key(firmware):
+    key = '-'.join(part for part in firmware if part)
+    return re.sub(r'[^\w.-]+', '_', key) or 'unknown'
+
+
+def _identifier(name):
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+
+def _literal(value, typename):
+    """ Source of a value repr printed by the board, None if it is not one
+    """
+    try:
+        ast.literal_eval(value)
+        return value
+    except (ValueError, SyntaxError):
+        if typename == 'float':
+            # nan, inf
+            return 'float({!r})'.format(value)
+        return None
+
+
+def _render_members(members, indent, in_class):
+    lines = []
+    for name, typename, value, children in members:
+        if not _identifier(name):
+            continue
+        if typename == 'type':
+            lines.append('{}class {}:'.format(indent, name))
+            body = _render_members(children or [], indent + '    ', True)
+            lines.extend(body or ['{}    pass'.format(indent)])
+            lines.append('')
+        elif typename in CALLABLE_TYPES:
+            args = 'self, *args, **kwargs' if in_class else '*args, **kwargs'
+            if typename in ('staticmethod', 'classmethod'):
+                lines.append('{}@{}'.format(indent, typename))
+                if typename == 'staticmethod':
+                    args = '*args, **kwargs'
+                else:
+                    args = 'cls, *args, **kwargs'
+            lines.append('{}def {}({}):'.format(indent, name, args))
+            lines.append('{}    pass'.format(indent))
+            lines.append('')
+        elif value is not None and _literal(value, typename):
+            lines.append('{}{} = {}'.format(indent, name,
+                                            _literal(value, typename)))
+        else:
+            lines.append('{}{} = None  # {}'.format(indent, name, typename))
+    return lines
+
+
+def render_module(name, members, firmware=None):
+    lines = ["'''", 'Stub for {} generated by device introspection'.format(name)]
+    if firmware:
+        lines.append('Firmware: {}'.format(' '.join(firmware)))
+    lines.extend(["'''", ''])
+    lines.extend(_render_members(members, '', False))
+    return '\n'.join(lines).rstrip('\n') + '\n'
+
+
+def write_stubs(firmware, modules):
+    """ Write the stub package for a firmware and make it the current one
+        :returns:
+            The directory holding the stubs
+    """
+    key = firmware_key(firmware or ('unknown',))
+    path = cache_dir('stubs', key)
+    for name, members in modules.items():
+        with open(os.path.join(path, '{}.py'.format(name)), 'w') as f:
+            f.write(render_module(name, members, firmware))
+    with open(os.path.join(cache_dir('stubs'), 'current'), 'w') as f:
+        f.write(key)
+    return path
+
+
+def stub_path():
+    """ Directory of the last generated stubs or None if there is none """
+    try:
+        with open(os.path.join(cache_dir('stubs'), 'current')) as f:
+            key = f.read().strip()
+    except IOError:
+        return None
+    path = os.path.join(cache_dir('stubs'), key)
+    return path if key and os.path.isdir(path) else None
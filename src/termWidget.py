@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import glob
+import collections
+import functools
 import pyte
 import serial
 import sys
@@ -12,39 +13,163 @@ import pyqode.qt.QtGui as QtGui
 from PyQt5.Qt import QApplication
 
 from myDef import i18n
+from linkProbe import BAUD_RATES, DEFAULT_BAUD
+from serialPorts import serial_ports
 
 
-def serial_ports():
-    """ Lists serial port names
-        :raises EnvironmentError:
-            On unsupported or unknown platforms
+#: xterm colors of the color names pyte uses, 256 color and true color
+#: values come as hex strings
+ANSI_COLORS = {
+    'black': '#000000', 'red': '#cd0000', 'green': '#00cd00',
+    'brown': '#cdcd00', 'yellow': '#cdcd00', 'blue': '#0000ee',
+    'magenta': '#cd00cd', 'cyan': '#00cdcd', 'white': '#e5e5e5',
+    'brightblack': '#7f7f7f', 'brightred': '#ff0000',
+    'brightgreen': '#00ff00', 'brightbrown': '#ffff00',
+    'brightyellow': '#ffff00', 'brightblue': '#5c5cff',
+    'brightmagenta': '#ff00ff', 'brightcyan': '#00ffff',
+    'brightwhite': '#ffffff',
+}
+
+@functools.lru_cache(maxsize=None)
+def ansi_color(name):
+    """ QColor of a pyte color name, None for the default color """
+    if name == 'default':
+        return None
+    color = QtGui.QColor(ANSI_COLORS.get(name, '#' + name))
+    return color if color.isValid() else None
+
+
+def char_style(c):
+    """ (fg, bg, bold, italics, underscore, strikethrough, reverse) """
+    return (c.fg, c.bg, c.bold, getattr(c, 'italics', False),
+            getattr(c, 'underscore', False),
+            getattr(c, 'strikethrough', False), getattr(c, 'reverse', False))
+
+
+def style_spans(row, columns):
+    """ Run-length spans of identical style of a pyte buffer row
         :returns:
-            A list of the serial ports available on the system
+            A list of (first column, text, style)
     """
-    if sys.platform.startswith('win'):
-        ports = ['COM%s' % (i + 1) for i in range(256)]
-    elif sys.platform.startswith('linux') or sys.platform.startswith('cygwin'):
-        # this excludes your current terminal "/dev/tty"
-        ports = glob.glob('/dev/tty[A-Za-z]*')
-    elif sys.platform.startswith('darwin'):
-        ports = glob.glob('/dev/tty.*')
-    else:
-        raise EnvironmentError('Unsupported platform')
-    result = []
-    for port in ports:
-        try:
-            s = serial.Serial(port)
-            s.close()
-            result.append(port)
-        except (OSError, serial.SerialException):
-            pass
-    return result
+    spans = []
+    for x in range(columns):
+        c = row[x]
+        style = char_style(c)
+        if spans and spans[-1][2] == style:
+            spans[-1][1].append(c.data)
+        else:
+            spans.append((x, [c.data], style))
+    return [(x, ''.join(text), style) for x, text, style in spans]
+
+
+#: Paste mode prompt, bytes written per chunk and most bytes not echoed yet
+PASTE_PROMPT = b'=== '
+PASTE_CHUNK = 32
+PASTE_WINDOW = 64
+PASTE_TIMEOUT = 5
+#: Pastes from this size on show their progress
+PASTE_PROGRESS_MIN = 2048
+
+
+class RemoteOp(object):
+    '''
+    Handle of an interceptor attached by Terminal.remoteExec. The
+    interceptor is detached, and whatever it buffered freed, when it returns
+    True, on cancel() or when no data arrived for timeout seconds.
+    '''
+    def __init__(self, interceptor, timeout=None, on_timeout=None):
+        self._interceptor = interceptor
+        self._on_timeout = on_timeout
+        self.timeout = timeout
+        self.timed_out = False
+        self.done = False
+        self._deadline = None
+        self._touch()
+
+    def _touch(self):
+        if self.timeout:
+            self._deadline = time.time() + self.timeout
+
+    def cancel(self):
+        self.done = True
+        self._interceptor = None
+        self._on_timeout = None
+
+    def feed(self, text):
+        if not self.done:
+            # the deadline moves while the board keeps answering
+            self._touch()
+            try:
+                if self._interceptor(text):
+                    self.cancel()
+            except Exception as e:
+                # a broken interceptor must not stop the read thread
+                print(('remoteExec interceptor failed: ', e))
+                self.cancel()
+        return self.done
+
+    def expire(self, now):
+        if not self.done and self._deadline and now > self._deadline:
+            on_timeout = self._on_timeout
+            self.timed_out = True
+            self.cancel()
+            if on_timeout:
+                on_timeout()
+        return self.done
+
+
+class PasteSender(object):
+    '''
+    Interceptor feeding text to the REPL paste mode (Ctrl-E). The board
+    echoes every byte, and a "=== " prompt after each line, so writes are
+    held back while more than PASTE_WINDOW bytes are not echoed yet.
+    '''
+    def __init__(self, data, write, progress=None):
+        self._data = data
+        self._write = write
+        self._progress = progress
+        self._sent = 0
+        self._expected = 0
+        self._received = 0
+        self._started = False
+        self._buf = b''
+
+    def __call__(self, text):
+        if not self._started:
+            self._buf += text
+            found = self._buf.find(PASTE_PROMPT)
+            if found < 0:
+                self._buf = self._buf[-len(PASTE_PROMPT):]
+                return False
+            self._started = True
+            text = self._buf[found + len(PASTE_PROMPT):]
+            self._buf = b''
+        self._received += len(text)
+        while self._sent < len(self._data) and \
+                self._expected - self._received < PASTE_WINDOW:
+            chunk = self._data[self._sent:self._sent + PASTE_CHUNK]
+            self._write(chunk)
+            self._sent += len(chunk)
+            self._expected += len(chunk) + \
+                chunk.count(b'\r') * (len(PASTE_PROMPT) + 1)
+            if self._progress:
+                self._progress(self._sent, len(self._data))
+        if self._sent == len(self._data) and \
+                self._received >= self._expected:
+            # all in, run it
+            self._write(b'\x04')
+            return True
+        return False
 
 
 class Terminal(QtWidgets.QWidget):
     '''
     classdocs
     '''
+    pasteProgress = QtCore.Signal(int, int)
+    # rows fed on the read thread, None for all of them
+    _rowsChanged = QtCore.Signal(object)
+
     def __init__(self, parent=None):
         '''
         Constructor
@@ -57,14 +182,23 @@ class Terminal(QtWidgets.QWidget):
         }.get(sys.platform, 'Courier'), 10))
         self.setFocusPolicy(QtCore.Qt.ClickFocus)
         self.setStyleSheet("background-color : black; color : #cccccc;")
-        self._workers = []
+        self._ops = []
+        self._opsLock = threading.Lock()
         self._serial = None
         self._thread = None
         self._stream = pyte.Stream()
         self._vt = pyte.Screen(80, 24)
         self._stream.attach(self._vt)
-        self._workers.append(self._processText)
         self._stop = threading.Event()
+        self._cell = None
+        self._lineCache = collections.OrderedDict()
+        self._fonts = {}
+        self._rowSpans = {}
+        self._cursorShown = QtCore.QRect()
+        self._paste = None
+        self._pasteDialog = None
+        self.pasteProgress.connect(self._pasteProgress)
+        self._rowsChanged.connect(self._invalidateRows)
         
    
     def mousePressEvent(self, QMouseEvent):
@@ -86,16 +220,66 @@ class Terminal(QtWidgets.QWidget):
     
     def paste(self):
         clipText = QApplication.clipboard().text()
-        if clipText:
-            self._serial.write(clipText.encode())
+        if clipText and self._serial:
+            self.pasteText(clipText)
+
+    def pasteText(self, text):
+        '''paste mode keeps the indentation, the writes are paced by the
+           board echo'''
+        data = text.replace('\r\n', '\n').rstrip('\n').replace('\n', '\r')
+        data = data.encode('utf-8')
+        sender = PasteSender(data, self.write, self.pasteProgress.emit)
+        self._paste = self.remoteExec(b'\x05', sender, PASTE_TIMEOUT,
+                                      self.cancelPaste)
+        if len(data) >= PASTE_PROGRESS_MIN:
+            self._pasteDialog = QtWidgets.QProgressDialog(
+                i18n("Pasting"), i18n("Cancel"), 0, len(data), self)
+            self._pasteDialog.setMinimumDuration(500)
+            self._pasteDialog.canceled.connect(self.cancelPaste)
+
+    def _pasteProgress(self, sent, total):
+        if self._pasteDialog:
+            self._pasteDialog.setValue(sent)
+            if sent >= total:
+                self._pasteDialog.deleteLater()
+                self._pasteDialog = None
+
+    def cancelPaste(self):
+        paste, self._paste = self._paste, None
+        if paste and (paste.timed_out or not paste.done):
+            paste.cancel()
+            if paste._started:
+                # leave paste mode without running anything, before the
+                # prompt Ctrl-C would stop the program still running
+                self._serial.write(b'\x03')
+        if self._pasteDialog:
+            # may be called from the read thread on timeout
+            QtCore.QMetaObject.invokeMethod(self._pasteDialog, 'deleteLater',
+                                            QtCore.Qt.QueuedConnection)
+            self._pasteDialog = None
 
         
+    def cellSize(self):
+        '''size of one character cell, measured once per font'''
+        if self._cell is None:
+            metrics = QtGui.QFontMetrics(self.font())
+            self._cell = QtCore.QSize(metrics.width(' '), metrics.height())
+        return self._cell
+
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.FontChange:
+            self._cell = None
+            self._lineCache.clear()
+            self._fonts.clear()
+        super(Terminal, self).changeEvent(event)
+
     def resizeEvent(self, event):
-        charSize = self.textRect(' ').size()
+        charSize = self.cellSize()
         lines = int(event.size().height() / charSize.height())
         columns = int(event.size().width() / charSize.width())
         self._vt.resize(lines, columns)
         self._vt.reset()
+        self._rowSpans.clear()
 
     def focusNextPrevChild(self, n):
         return False
@@ -110,6 +294,8 @@ class Terminal(QtWidgets.QWidget):
 
     def open(self, port, speed):
         self._stopThread()
+        # nothing pending belongs to the new connection
+        self.cancelAll()
         if type(self._serial) is serial.Serial:
             self._serial.close()
         try:
@@ -120,14 +306,38 @@ class Terminal(QtWidgets.QWidget):
             print(e)
             return False
 
-    def remoteExec(self, cmd, interceptor=None):
+    def write(self, data):
+        '''write data at once, for interceptors pacing their own writes on
+           the board's answers'''
+        self._serial.write(data)
+
+    def setBaud(self, speed):
+        '''change the rate of the open port'''
+        if self._serial:
+            self._serial.baudrate = speed
+
+    def remoteExec(self, cmd, interceptor=None, timeout=None, on_timeout=None):
+        '''write cmd, interceptor(text) then sees the incoming data until it
+           returns True
+           :returns: a RemoteOp handle, None without interceptor
+        '''
+        op = None
         if interceptor:
-            self._workers.append(interceptor)
+            op = RemoteOp(interceptor, timeout, on_timeout)
+            with self._opsLock:
+                self._ops.append(op)
         cmd_b = cmd if isinstance(cmd, bytes) else bytes(cmd, encoding='utf8')
         # write command
         for i in range(0, len(cmd_b), 256):
             self._serial.write(cmd_b[i:min(i + 256, len(cmd_b))])
             time.sleep(0.01)
+        return op
+
+    def cancelAll(self):
+        with self._opsLock:
+            ops, self._ops = self._ops, []
+        for op in ops:
+            op.cancel()
 
     def _stopThread(self):
         self._stop.set()
@@ -146,42 +356,133 @@ class Terminal(QtWidgets.QWidget):
             while not self._stop.is_set():
                 text = self._serial.read(self._serial.inWaiting() or 1)
                 if text:
-                    self._workers = [w for w in self._workers if not w(text)]
+                    self._processText(text)
+                self._dispatch(text)
         except Exception as e:
             print(e)
 
+    def _dispatch(self, text):
+        now = time.time()
+        with self._opsLock:
+            ops = list(self._ops)
+        # ops attached meanwhile are kept, they see the next data
+        finished = set(op for op in ops
+                       if (op.feed(text) if text else op.expire(now)))
+        if finished:
+            with self._opsLock:
+                self._ops = [op for op in self._ops if op not in finished]
+
     def _processText(self, text):
         self._stream.feed(text.decode(errors='ignore'))
-        self.update()
-        return False
+        dirty = getattr(self._vt, 'dirty', None)
+        if dirty is None:
+            self._rowsChanged.emit(None)
+            return
+        # the span cache belongs to the GUI thread, it is dropped there
+        self._rowsChanged.emit(set(dirty))
+        dirty.clear()
+
+    @QtCore.Slot(object)
+    def _invalidateRows(self, rows):
+        if rows is None:
+            self._rowSpans.clear()
+            self.update()
+            return
+        # only the changed lines and where the cursor was and is now
+        h = self.cellSize().height()
+        for y in rows:
+            self._rowSpans.pop(y, None)
+            self.update(0, y * h, self.width(), h)
+        self.update(self._cursorShown.adjusted(0, 0, 1, 1))
+        self.update(self.cursorRect().adjusted(0, 0, 1, 1))
 
     def focusInEvent(self, event):
-        self.repaint()
+        self.update(self.cursorRect().adjusted(0, 0, 1, 1))
 
     def focusOutEvent(self, event):
-        self.repaint()
+        self.update(self.cursorRect().adjusted(0, 0, 1, 1))
+
+    def styleFont(self, style):
+        key = style[2:6]
+        font = self._fonts.get(key)
+        if font is None:
+            font = QtGui.QFont(self.font())
+            font.setBold(style[2])
+            font.setItalic(style[3])
+            font.setUnderline(style[4])
+            font.setStrikeOut(style[5])
+            self._fonts[key] = font
+        return font
+
+    def styleColors(self, style):
+        '''(foreground, background) of a style, background None when it
+           is the widget one'''
+        pal = self.palette()
+        fg = ansi_color(style[0])
+        bg = ansi_color(style[1])
+        if style[6]:
+            fg, bg = (bg or pal.color(pal.Background),
+                      fg or pal.color(pal.Foreground))
+        return fg or pal.color(pal.Foreground), bg
+
+    def rowSpans(self, y):
+        spans = self._rowSpans.get(y)
+        if spans is None:
+            spans = style_spans(self._vt.buffer[y], self._vt.columns)
+            self._rowSpans[y] = spans
+        return spans
+
+    def staticText(self, text, font):
+        '''laid out text of a span, cached by content and font'''
+        key = (text, font.key())
+        st = self._lineCache.get(key)
+        if st is None:
+            st = QtGui.QStaticText(text)
+            st.setTextFormat(QtCore.Qt.PlainText)
+            st.setPerformanceHint(QtGui.QStaticText.AggressiveCaching)
+            st.prepare(QtGui.QTransform(), font)
+            self._lineCache[key] = st
+            # a few screens worth of spans
+            if len(self._lineCache) > 8 * max(self._vt.lines, 24):
+                self._lineCache.popitem(last=False)
+        else:
+            self._lineCache.move_to_end(key)
+        return st
 
     def paintEvent(self, event):
         p = QtGui.QPainter()
         p.begin(self)
         pal = self.palette()
-        p.fillRect(QtCore.QRect(QtCore.QPoint(), self.size()),
-                   pal.color(pal.Background))
-        textSize = self.textRect(' ' * self._vt.columns).size()
-        bound = QtCore.QRect(QtCore.QPoint(), textSize)
-        flags = QtCore.Qt.AlignLeft | QtCore.Qt.AlignBottom
-        for line in self._vt.display:
-            p.drawText(bound, flags, line)
-            bound.translate(0, bound.height())
+        p.fillRect(event.rect(), pal.color(pal.Background))
+        w = self.cellSize().width()
+        h = self.cellSize().height()
+        first = max(0, event.rect().top() // h)
+        last = min(event.rect().bottom() // h, self._vt.lines - 1)
+        for y in range(first, last + 1):
+            # one draw call per run of identically styled characters
+            for x, text, style in self.rowSpans(y):
+                fg, bg = self.styleColors(style)
+                if bg is not None:
+                    p.fillRect(x * w, y * h, len(text) * w, h, bg)
+                if not text.strip() and not style[4] and not style[5]:
+                    continue
+                font = self.styleFont(style)
+                p.setFont(font)
+                p.setPen(fg)
+                p.drawStaticText(QtCore.QPoint(x * w, y * h),
+                                 self.staticText(text, font))
+        p.setPen(pal.color(pal.Foreground))
+        # the cursor is an overlay, it never invalidates the cached lines
+        self._cursorShown = self.cursorRect()
         if self.hasFocus():
-            p.fillRect(self.cursorRect(), pal.color(pal.Foreground))
+            p.fillRect(self._cursorShown, pal.color(pal.Foreground))
         else:
-            p.drawRect(self.cursorRect())
+            p.drawRect(self._cursorShown)
         p.end()
 
     def textRect(self, text):
-        textSize = QtGui.QFontMetrics(self.font()).size(0, text)
-        return QtCore.QRect(QtCore.QPoint(), textSize)
+        cell = self.cellSize()
+        return QtCore.QRect(0, 0, cell.width() * len(text), cell.height())
 
     def cursorRect(self):
         r = self.textRect(' ')
@@ -213,12 +514,16 @@ def selectPort():
     l = QtWidgets.QVBoxLayout(d)
     combo = QtWidgets.QComboBox(d)
     combo.addItems(serial_ports())
+    baud = QtWidgets.QComboBox(d)
+    baud.addItems([str(r) for r in BAUD_RATES])
+    baud.setCurrentIndex(BAUD_RATES.index(DEFAULT_BAUD))
     ok = QtWidgets.QPushButton("Ok", d)
     ok.clicked.connect(d.close)
     l.addWidget(combo)
+    l.addWidget(baud)
     l.addWidget(ok)
     d.exec_()
-    return combo.currentText()
+    return combo.currentText(), int(baud.currentText())
 
 
 def main():
@@ -226,7 +531,7 @@ def main():
     w = Terminal()
     w.resize(640, 480)
     w.show()
-    w.open(selectPort(), 115200)
+    w.open(*selectPort())
     w.remoteExec('\x04')
     app.exec_()
 
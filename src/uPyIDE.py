@@ -1,31 +1,42 @@
 #!/usr/bin/env python3
-import tendo.singleton
 import os
 import re
 import sys
-import glob
-import collections
+import threading
+import json
+
+import singleInstance
+
+if __name__ == '__main__' and singleInstance.forward(sys.argv[1:]):
+    # an IDE is already running and took the files, skip the Qt start up
+    sys.exit(0)
 
-import pyqode.python.backend.server as server
 import pyqode.python.widgets as widgets
 import pyqode.core.widgets as wcore
 import pyqode.qt.QtCore as QtCore
 import pyqode.qt.QtWidgets as QtWidgets
 import pyqode.qt.QtGui as QtGui
-import pyqode_i18n
-import termWidget
-import xml.etree.ElementTree as ElementTree
-
-import markdown
-
-from myDef import i18n
+import pyqode.qt.QtNetwork as QtNetwork
+import stubGen
+import analysisScheduler
+import autosaveJournal
+import linkProbe
+import phaseTimer
+
+from myDef import i18n, cache_dir
 # from docutils.parsers.rst.directives import path
 
-
-me = tendo.singleton.SingleInstance()
+# xml.etree, termWidget (pyte, pyserial) and the modules of the board
+# features are imported on first use, see startupProfile.py for the
+# import-time budget
 
 __version__ = '1.0'
 
+#: Seconds without an answer from the board before one of the IDE's own
+#: scripts or transfers is given up, user code has no deadline
+EXEC_TIMEOUT = 10
+TRANSFER_TIMEOUT = 10
+
 
 
 def executable_path():
@@ -62,7 +73,9 @@ def completion_server():
         print(server_path)
         return server_path
     else:
-        return server.__file__
+        # ours puts the firmware stubs before the standard library
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'server.py')
 
 
 def about_pixmap():
@@ -82,12 +95,16 @@ class PortSelector(QtWidgets.QComboBox):
     def __init__(self, parent):
         super(self.__class__, self).__init__(parent)
         self.widget = parent
-        portList = termWidget.serial_ports()
-        print(portList)
-        self.addItems(portList)
         self.currentIndexChanged.connect(self.onChange)
+
+    def refresh(self):
+        import serialPorts
+        self.blockSignals(True)
+        self.clear()
+        self.addItems(serialPorts.serial_ports())
+        self.blockSignals(False)
         self.setCurrentIndex(0)
-        # self.onChange(0)
+        self.onChange(0)
 
     @QtCore.Slot(int)
     def onChange(self, n):
@@ -96,59 +113,210 @@ class PortSelector(QtWidgets.QComboBox):
             self.widget.setPort(port)
 
 
-class SnipplerWidget(QtWidgets.QDockWidget):
+class BaudSelector(QtWidgets.QComboBox):
+    def __init__(self, parent):
+        super(BaudSelector, self).__init__(parent)
+        self.widget = parent
+        self.addItems([str(r) for r in linkProbe.BAUD_RATES])
+        self.setRate(linkProbe.DEFAULT_BAUD)
+        self.currentIndexChanged.connect(self.onChange)
+
+    def setRate(self, rate):
+        self.blockSignals(True)
+        self.setCurrentText(str(rate))
+        self.blockSignals(False)
+
+    @QtCore.Slot(int)
+    def onChange(self, n):
+        self.widget.setBaud(int(self.currentText()))
+
+
+class LazyDockWidget(QtWidgets.QDockWidget):
+    '''Dock widget that builds its contents the first time it is shown'''
+    def __init__(self, title, parent):
+        super(LazyDockWidget, self).__init__(title, parent)
+        self.setWindowTitle(title)
+        self.setObjectName(title)
+        self._built = False
+
+    def isBuilt(self):
+        return self._built
+
+    def ensureBuilt(self):
+        if not self._built:
+            self._built = True
+            self.setWidget(self.createContents())
+
+    def createContents(self):
+        raise NotImplementedError
+
+    def showEvent(self, event):
+        self.ensureBuilt()
+        super(LazyDockWidget, self).showEvent(event)
+
+
+class OutlineWidget(LazyDockWidget):
+    '''
+    Keeps one outline tree per editor, each one follows the analysis results
+    of its editor so switching tabs only changes the visible page
+    '''
+    def __init__(self, parent):
+        super(OutlineWidget, self).__init__(i18n('Outline'), parent)
+        self._editor = None
+        self._trees = {}
+        self.stack = None
+
+    def createContents(self):
+        self.stack = QtWidgets.QStackedWidget(self)
+        self._empty = widgets.PyOutlineTreeWidget(self.stack)
+        self._empty.set_editor(None)
+        self.stack.addWidget(self._empty)
+        self.setEditor(self._editor)
+        return self.stack
+
+    def setEditor(self, editor):
+        self._editor = editor
+        if not self.stack:
+            return
+        if editor is None:
+            self.stack.setCurrentWidget(self._empty)
+            return
+        tree = self._trees.get(editor)
+        if tree is None:
+            tree = widgets.PyOutlineTreeWidget(self.stack)
+            tree.set_editor(editor)
+            self._trees[editor] = tree
+            self.stack.addWidget(tree)
+        self.stack.setCurrentWidget(tree)
+
+    def removeEditor(self, editor):
+        tree = self._trees.pop(editor, None)
+        if tree:
+            tree.set_editor(None)
+            self.stack.removeWidget(tree)
+            tree.deleteLater()
+        if editor is self._editor:
+            self._editor = None
+
+
+class SnippletModel(QtCore.QAbstractListModel):
+    '''List model over a SnippletIndex, bodies are read for tooltips only'''
+    def __init__(self, index, parent=None):
+        super(SnippletModel, self).__init__(parent)
+        self._index = index
+        self._filter = ''
+        self._rows = index.entries
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        entry = self._rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return entry['name']
+        if role == QtCore.Qt.ToolTipRole:
+            return self._index.body(entry)
+        return None
+
+    def snipplet(self, index):
+        return self._index.body(self._rows[index.row()])
+
+    def setFilter(self, text):
+        self.beginResetModel()
+        self._filter = text
+        self._rows = self._index.search(text)
+        self.endResetModel()
+
+    def reload(self):
+        if self._index.refresh():
+            self.setFilter(self._filter)
+
+
+class SnipplerWidget(LazyDockWidget):
     def __init__(self, parent):
         super(SnipplerWidget, self).__init__(i18n('Snipplets'), parent)
-        self.setWindowTitle(i18n("Snipplets"))
-        self.snippletView = QtWidgets.QListWidget(self)
-        self.setWidget(self.snippletView)
+
+    def createContents(self):
+        import snippletIndex
+        widget = QtWidgets.QWidget(self)
+        vlayout = QtWidgets.QVBoxLayout()
+        vlayout.setContentsMargins(0, 0, 0, 0)
+        self.filterEdit = QtWidgets.QLineEdit(widget)
+        self.filterEdit.setPlaceholderText(i18n("Filter"))
+        self.snippletView = QtWidgets.QListView(widget)
+        self.snippletView.setUniformItemSizes(True)
+        self.snippletView.setStyleSheet('''QToolTip {
+            font-family: "monospace";
+        }''')
+        self.index = snippletIndex.SnippletIndex(
+            [os.path.join(share(), 'snipplet'), cache_dir('snipplets')],
+            os.path.join(cache_dir(), 'snipplets.json'))
+        self.model = SnippletModel(self.index, self)
+        self.snippletView.setModel(self.model)
+        self.snippletView.doubleClicked.connect(self._insertToParent)
+        self.filterEdit.textChanged.connect(self.model.setFilter)
+        vlayout.addWidget(self.filterEdit)
+        vlayout.addWidget(self.snippletView)
+        widget.setLayout(vlayout)
         self.loadSnipplets()
-        self.snippletView.itemDoubleClicked.connect(self._insertToParent)
+        return widget
 
-    def _insertToParent(self, item):
+    def _insertToParent(self, index):
         if self.parent().tabber.active_editor:
-            self.parent().tabber.active_editor.insertPlainText(item.toolTip())
-
-    def addSnipplet(self, description, contents):
-        item = QtWidgets.QListWidgetItem(self.snippletView)
-        item.setText(description)
-        item.setToolTip(contents)
-
-    def loadSnippletFrom(self, inp):
-        xml = ElementTree.fromstring(inp) if type(inp) is str else \
-            ElementTree.parse(inp).getroot()
-        for child in xml:
-            self.addSnipplet(child.attrib["name"], child.text)
-
-    def loadCodeSnipplet(self, source):
-        with open(source) as f:
-            s = f.read()
-            r = re.compile(r'^# Description: (.*)[\r\n]*')
-            description = ''.join(re.findall(r, s))
-            contents = re.sub(r, '', s)
-            if description and contents:
-                self.addSnipplet(description, contents)
+            self.parent().tabber.active_editor.insertPlainText(
+                self.model.snipplet(index))
 
     @QtCore.Slot()
     def loadSnipplets(self):
-        self.snippletView.setStyleSheet('''QToolTip {
-            font-family: "monospace";
-        }''')
-        with open(os.path.join(share(), 'snipplet', 'snipplets.xml')) as f:
-            self.loadSnippletFrom(f)
-        snipplet_glob = os.path.join(share(), 'snipplet', '*.py')
-        for source in glob.glob(snipplet_glob):
-            self.loadCodeSnipplet(source)
+        self.model.reload()
 
-class DeviceFilesWidget(QtWidgets.QDockWidget):
+class CellOutputWidget(LazyDockWidget):
+    '''
+    Output of the cells and selections run on the board, one entry per run
+    '''
+    def __init__(self, parent):
+        super(CellOutputWidget, self).__init__(i18n('Cell output'), parent)
+        self._runs = []
+
+    def createContents(self):
+        splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical, self)
+        self.runsView = QtWidgets.QListWidget(splitter)
+        self.outputView = QtWidgets.QPlainTextEdit(splitter)
+        self.outputView.setReadOnly(True)
+        self.outputView.setFont(QtGui.QFont('Monospace'))
+        self.runsView.currentRowChanged.connect(self._showRun)
+        for title, out, err in self._runs:
+            self.runsView.addItem(title)
+        return splitter
+
+    def addRun(self, title, out, err):
+        self._runs.append((title, out, err))
+        self.show()
+        self.raise_()
+        self.ensureBuilt()
+        self.runsView.addItem(title)
+        self.runsView.setCurrentRow(len(self._runs) - 1)
+
+    def _showRun(self, n):
+        if 0 <= n < len(self._runs):
+            title, out, err = self._runs[n]
+            self.outputView.setPlainText(out + err)
+
+
+class DeviceFilesWidget(LazyDockWidget):
     def __init__(self, parent):
         super(DeviceFilesWidget, self).__init__(i18n('Device files'), parent)
-        self.setWindowTitle(i18n("Device files"))
+
+    def createContents(self):
         widget = QtWidgets.QWidget(self)
         vlayout = QtWidgets.QVBoxLayout()
         self.toolbar = QtWidgets.QToolBar(self)
         self.toolbar.addAction(i18n("Refresh"), self.loadRemoteFiles)
         self.toolbar.addAction(icon("download"), i18n("Download to Device"), self.downloadFile)
+        self.toolbar.addAction(i18n("Generate stubs"), self.generateStubs)
+        self.toolbar.addAction(i18n("Probe link"), self.probeLink)
         self.filesView = QtWidgets.QTreeWidget(self)
         self.filesView.header().close()
         self.deviceItem = QtWidgets.QTreeWidgetItem(0)
@@ -157,7 +325,7 @@ class DeviceFilesWidget(QtWidgets.QDockWidget):
         vlayout.addWidget(self.toolbar)
         vlayout.addWidget(self.filesView)
         widget.setLayout(vlayout)
-        self.setWidget(widget)
+        return widget
     
     @QtCore.Slot()
     def loadRemoteFiles(self):
@@ -168,52 +336,250 @@ class DeviceFilesWidget(QtWidgets.QDockWidget):
         #print(self.parent().windowTitle())
         print('TODO: download selected File')
         pass
-        
+
+    @QtCore.Slot()
+    def generateStubs(self):
+        self.parent().generateStubs()
+
+    @QtCore.Slot()
+    def probeLink(self):
+        self.parent().probeLink()
+
+
+class Project(QtCore.QObject):
+    '''
+    Project root with its file index, kept current from file system
+    notifications instead of rescans
+    '''
+    changed = QtCore.Signal()
+
+    def __init__(self, root, parent=None):
+        import importGraph
+        import projectIndex
+        super(Project, self).__init__(parent)
+        self.index = projectIndex.ProjectIndex(root)
+        if self.index.refresh():
+            self.index.save()
+        self.graph = importGraph.ImportGraph(
+            self.index, [stubGen.stub_path(), fakelibs()])
+        self._saveTimer = QtCore.QTimer(self)
+        self._saveTimer.setSingleShot(True)
+        self._saveTimer.setInterval(2000)
+        self._saveTimer.timeout.connect(self.index.save)
+        self._watcher = QtCore.QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._directoryChanged)
+        self._watcher.fileChanged.connect(self._fileChanged)
+        self._watch(self.index.directories())
+        self._watch(self.index.abspath(rel) for rel in self.index.files)
+
+    @property
+    def root(self):
+        return self.index.root
+
+    def _watch(self, paths):
+        paths = [p for p in paths if os.path.exists(p)]
+        if paths:
+            self._watcher.addPaths(paths)
+
+    def _changed(self):
+        self._saveTimer.start()
+        self.changed.emit()
+
+    def _fileChanged(self, path):
+        if self.index.update_file(path):
+            self._changed()
+        # editors saving through a new file drop the watch, add it again
+        if os.path.exists(path) and path not in self._watcher.files():
+            self._watcher.addPath(path)
+
+    def _directoryChanged(self, path):
+        changed, new_dirs = self.index.update_dir(path)
+        self._watch(new_dirs)
+        known = set(self._watcher.files())
+        self._watch(self.index.abspath(rel) for rel in self.index.files
+                    if self.index.abspath(rel) not in known)
+        if changed:
+            self._changed()
+
+    def close(self):
+        self._saveTimer.stop()
+        self.index.save()
+        self.graph.save()
+
+
+class InstanceServer(QtCore.QObject):
+    '''
+    Receives the files of later launches, see singleInstance.py
+    '''
+    onFiles = QtCore.Signal(list)
+
+    def __init__(self, parent=None):
+        super(InstanceServer, self).__init__(parent)
+        self._server = QtNetwork.QTcpServer(self)
+        self._server.newConnection.connect(self._accept)
+        self._token = None
+        if self._server.listen(QtNetwork.QHostAddress.LocalHost, 0):
+            self._token = singleInstance.publish(self._server.serverPort())
+
+    def _accept(self):
+        while self._server.hasPendingConnections():
+            sock = self._server.nextPendingConnection()
+            sock.readyRead.connect(lambda s=sock: self._read(s))
+
+    def _read(self, sock):
+        if not sock.canReadLine():
+            return
+        try:
+            token, files = singleInstance.decode(bytes(sock.readLine()))
+        except ValueError:
+            token, files = None, []
+        if token == self._token:
+            sock.write(b'ok\n')
+            self.onFiles.emit(files)
+        sock.disconnectFromHost()
+        sock.deleteLater()
+
+    def close(self):
+        self._server.close()
+        singleInstance.unpublish()
+
+
+class PlaceholderTab(QtWidgets.QLabel):
+    '''
+    Stands for a restored file until its tab is first shown, so restoring a
+    session does not start one editor backend per tab
+    '''
+    class _File(object):
+        def __init__(self, path):
+            self.path = path
+
+    def __init__(self, path, parent=None):
+        super(PlaceholderTab, self).__init__(parent)
+        self.setAlignment(QtCore.Qt.AlignCenter)
+        self.setText(path)
+        self.file = self._File(path)
+        self.dirty = False
+        self._tab_name = os.path.basename(path)
+
+
+class QuickOpenDialog(QtWidgets.QDialog):
+    def __init__(self, project, parent):
+        super(QuickOpenDialog, self).__init__(parent)
+        self.setWindowTitle(i18n("Quick open"))
+        self.project = project
+        l = QtWidgets.QVBoxLayout(self)
+        self.edit = QtWidgets.QLineEdit(self)
+        self.list = QtWidgets.QListWidget(self)
+        l.addWidget(self.edit)
+        l.addWidget(self.list)
+        self.edit.textChanged.connect(self._filter)
+        self.edit.returnPressed.connect(self.accept)
+        self.list.itemActivated.connect(self.accept)
+        self._filter('')
+        self.resize(480, 320)
+
+    def _filter(self, text):
+        self.list.clear()
+        self.list.addItems(self.project.index.quick_open(text))
+        self.list.setCurrentRow(0)
+
+    def selectedPath(self):
+        item = self.list.currentItem()
+        return self.project.index.abspath(item.text()) if item else None
+
+
 class MainWindow(QtWidgets.QMainWindow):
     onListDir = QtCore.Signal(str)
-
-    def __init__(self):
+    onStubs = QtCore.Signal(object)
+    onMemReport = QtCore.Signal(object)
+    onMemChecked = QtCore.Signal(object)
+    onBundleDone = QtCore.Signal(object)
+    onSignature = QtCore.Signal(object)
+    onProbe = QtCore.Signal(object)
+    onReloaded = QtCore.Signal(object)
+    onCellDone = QtCore.Signal(object)
+    onTimeout = QtCore.Signal(str)
+
+    def __init__(self, timer=None):
         QtWidgets.QMainWindow.__init__(self)
+        mark = timer.mark if timer else lambda phase: None
         self.setWindowTitle(i18n("Edu CIAA MicroPython"))
         self.cwd = QtCore.QDir.homePath()
+        self.settings = QtCore.QSettings('uPyIDE', 'uPyIDE')
+        self.project = None
+        self.instance = None
+        self.journal = None
         self.tabber = wcore.TabWidget(self)
-        self.term = termWidget.Terminal(self)
-        self.outline = widgets.PyOutlineTreeWidget()
-        self.dock_outline = QtWidgets.QDockWidget(i18n('Outline'))
-        self.dock_outline.setWidget(self.outline)
+        self.term = None
+        self.port = None
+        self.baud = linkProbe.DEFAULT_BAUD
+        self._linkProbe = None
+        self._pendingReload = None
+        self._targetOp = None
+        self.inflater = None
+        self._probed = False
+        self._helpDialog = None
+        self.analysis = analysisScheduler.AnalysisScheduler(self)
+        self.dock_outline = OutlineWidget(self)
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.dock_outline)
         self.snippler = SnipplerWidget(self)
         self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.snippler)
+        self.tabifyDockWidget(self.dock_outline, self.snippler)
+        self.dock_outline.raise_()
         self.deviceFiles = DeviceFilesWidget(self)
         self.addDockWidget(QtCore.Qt.LeftDockWidgetArea, self.deviceFiles)
+        self.cellOutput = CellOutputWidget(self)
+        self.addDockWidget(QtCore.Qt.BottomDockWidgetArea, self.cellOutput)
+        self.cellOutput.hide()
+        mark('docks')
         self.stack = QtWidgets.QStackedWidget(self)
         self.stack.addWidget(self.tabber)
-        self.stack.addWidget(self.term)
         self.setCentralWidget(self.stack)
         self.makeAppToolBar()
+        mark('toolbar')
         self.resize(1024, 600)
         self.onListDir.connect(lambda l: self._showDir(l))
+        self.onStubs.connect(self._saveStubs)
+        self.onMemReport.connect(self._showMemReport)
+        self.onMemChecked.connect(self._memoryChecked)
+        self.onBundleDone.connect(self._bundleDone)
+        self.onSignature.connect(self._sendDelta)
+        self.onProbe.connect(self._probeDone)
+        self.onReloaded.connect(self._reloaded)
+        self.onCellDone.connect(self._cellDone)
+        self.onTimeout.connect(self._remoteTimeout)
         self.tabber.currentChanged.connect(self.actualizeOutline)
-        self.fileNew()
-        self.portSelector.onChange(0)
+        self.tabber.tab_closed.connect(self.dock_outline.removeEditor)
+        self.tabber.tab_closed.connect(self.analysis.unregister)
+        self.analysis.analysed.connect(
+            lambda editor: self._estimateLater([editor.toPlainText()]))
 
     def actualizeOutline(self, n):
-        self.outline.set_editor(self.tabber.active_editor)
-        self.i18n()
-
-    def i18n(self, actions=None):
-        if not self.tabber.active_editor:
+        if isinstance(self.tabber.active_editor, PlaceholderTab):
+            # not from inside currentChanged, the tabs are about to change
+            placeholder = self.tabber.active_editor
+            QtCore.QTimer.singleShot(0, lambda: self._realize(placeholder))
             return
-        if not actions:
-            actions = self.tabber.active_editor.actions()
+        self.dock_outline.setEditor(self.tabber.active_editor)
+        self.analysis.setActive(self.tabber.active_editor)
+
+    def i18n(self, actions):
         for action in actions:
             if not action.isSeparator():
-                action.setText(pyqode_i18n.tr(action.text()))
+                action.setText(i18n(action.text()))
             if action.menu():
                 self.i18n(action.menu().actions())
 
+    def terminal(self):
+        if self.term is None:
+            import termWidget
+            self.term = termWidget.Terminal(self)
+            self.stack.addWidget(self.term)
+        return self.term
+
     def terminate(self):
-        self.term.close()
+        if self.term:
+            self.term.close()
 
     def makeAppToolBar(self):
         bar = QtWidgets.QToolBar('Toolbar', self)
@@ -221,17 +587,42 @@ class MainWindow(QtWidgets.QMainWindow):
         bar.addAction(icon("document-new"), i18n("New"), self.fileNew)
         bar.addAction(icon("document-open"), i18n("Open"), self.fileOpen)
         bar.addAction(icon("document-save"), i18n("Save"), self.fileSave)
+        memory = bar.addAction(i18n("Memory"), self.memoryEstimate)
+        self.boardMenu = QtWidgets.QMenu(i18n("Board"), self)
+        # boards.json may change, the menu is filled when shown
+        self.boardMenu.aboutToShow.connect(self._fillBoardMenu)
+        memory.setMenu(self.boardMenu)
+        bar.widgetForAction(memory).setPopupMode(
+            QtWidgets.QToolButton.MenuButtonPopup)
+        bar.addAction(i18n("Project"), self.projectOpen)
+        quickOpen = QtWidgets.QAction(i18n("Quick open"), self)
+        quickOpen.setShortcut(QtGui.QKeySequence('Ctrl+P'))
+        quickOpen.triggered.connect(self.quickOpen)
+        self.addAction(quickOpen)
         bar.addWidget(WidgetSpacer(self))
         bar.addWidget(QtWidgets.QLabel(i18n("Serial Port:")))
         bar.addWidget(WidgetSpacer(self, 12))
         self.portSelector = PortSelector(self)
         bar.addWidget(self.portSelector)
         self.portSelector.setToolTip(i18n("Select Serial Port"))
+        self.baudSelector = BaudSelector(self)
+        bar.addWidget(self.baudSelector)
+        self.baudSelector.setToolTip(i18n("Baud rate"))
         self.runAction = bar.addAction(icon("run"), i18n("Run"), self.progRun)
         self.runAction.setEnabled(False)
+        self.reloadAction = bar.addAction(i18n("Reload module"),
+                                          self.reloadModule)
+        self.reloadAction.setEnabled(False)
+        self.cellAction = bar.addAction(i18n("Run cell"), self.runCell)
+        self.cellAction.setShortcut(QtGui.QKeySequence('Ctrl+Return'))
+        self.cellAction.setToolTip(i18n("Run the selection or the # %% cell "
+                                        "at the cursor"))
+        self.cellAction.setEnabled(False)
         self.dlAction = bar.addAction(icon("download"), i18n("Download"),
                                       self.progDownload)
         self.dlAction.setEnabled(False)
+        self.deployAction = bar.addAction(i18n("Deploy"), self.deployProject)
+        self.deployAction.setEnabled(False)
         self.termAction = bar.addAction(icon("terminal"), i18n("Terminal"),
                                         self.openTerm)
         self.termAction.setEnabled(False)
@@ -249,6 +640,12 @@ class MainWindow(QtWidgets.QMainWindow):
         return os.path.abspath(os.path.join(share(), 'help.css'))
 
     def showhelp(self):
+        if not self._helpDialog:
+            self._helpDialog = self._makeHelpDialog()
+        self._helpDialog.exec_()
+
+    def _makeHelpDialog(self):
+        import helpCache
         dlg = QtWidgets.QDialog(self)
         dlg.setWindowTitle(i18n('Help'))
         l = QtWidgets.QVBoxLayout(dlg)
@@ -267,22 +664,16 @@ class MainWindow(QtWidgets.QMainWindow):
         tabWidget.addTab(tv, i18n('Help'))
         with open(self._cssfile()) as f:
             tv.document().setDefaultStyleSheet(f.read())
-        try:
-            with open(self._mdhelp()) as f:
-                tv.document().setHtml(markdown.markdown(f.read()))
-        except:
-            try:
-                with open(self._htmlhelp()) as f:
-                    tv.document().setHtml(f.read())
-            except:
-                tv.setHtml("No help")
-        dlg.exec_()
+        tv.document().setHtml(helpCache.help_html(self._mdhelp(),
+                                                  self._htmlhelp()))
+        return dlg
 
     def terminalMenu(self):
+        import serialPorts
         m = QtWidgets.QMenu(self)
         g = QtWidgets.QActionGroup(m)
         g.triggered.connect(lambda a: self.setPort(a.text()))
-        for s in termWidget.serial_ports():
+        for s in serialPorts.serial_ports():
             a = m.addAction(s)
             g.addAction(a)
             a.setCheckable(True)
@@ -292,25 +683,166 @@ class MainWindow(QtWidgets.QMainWindow):
         return m
 
     def setPort(self, port):
-        en = self.term.open(port, 115200)
+        # another board may have another firmware
+        self._probed = False
+        self.port = port
+        self.baud = int(self.settings.value(
+            linkProbe.settings_key(port, 'baud'), linkProbe.DEFAULT_BAUD))
+        self.baudSelector.setRate(self.baud)
+        en = self.terminal().open(port, self.baud)
         [i.setEnabled(en) for i in (self.dlAction,
+                                    self.deployAction,
                                     self.runAction,
+                                    self.reloadAction,
+                                    self.cellAction,
                                     self.termAction)]
 
+    def setBaud(self, rate, persist=True):
+        '''persist: keep the rate for the next time the port is opened'''
+        self.baud = rate
+        if self.port:
+            if persist:
+                self.settings.setValue(
+                    linkProbe.settings_key(self.port, 'baud'), rate)
+            self.terminal().setBaud(rate)
+
+    def probeLink(self):
+        '''find the fastest rate the board and the adapter can do'''
+        if not self.port or self._linkProbe:
+            return
+        self._linkProbe = linkProbe.LinkProbe(self.terminal(),
+                                              self._internalExec,
+                                              self.baud, self)
+        self._linkProbe.finished.connect(self._linkProbed)
+        self._linkProbe.start()
+
+    def _linkProbed(self, rate, throughput):
+        self._linkProbe.deleteLater()
+        self._linkProbe = None
+        # the board is back to its default rate after a reset, the probed
+        # one is only used for this session
+        self.setBaud(rate, persist=False)
+        self.baudSelector.setRate(rate)
+        self.settings.setValue(
+            linkProbe.settings_key(self.port, 'fastest'), rate)
+        self.settings.setValue(
+            linkProbe.settings_key(self.port, 'throughput'), throughput)
+        QtWidgets.QMessageBox.information(
+            self, i18n("Probe link"),
+            i18n("Fastest reliable rate:") + ' {} baud\n'.format(rate) +
+            i18n("Throughput:") + ' {} bytes/s\n'.format(int(throughput)) +
+            i18n("Used until the board resets, unless boot.py sets it"))
+
+    def startJournal(self):
+        '''recover what a crash left in the journal, then start a new one'''
+        path = os.path.join(cache_dir(), 'journal')
+        recovered = autosaveJournal.recover(path)
+        self.journal = autosaveJournal.AutosaveJournal(path, self)
+        self.tabber.tab_closed.connect(self.journal.unregister)
+        if not recovered:
+            return
+        d = QtWidgets.QMessageBox(self)
+        d.setWindowTitle(i18n("Question"))
+        d.setText(i18n("Unsaved changes were recovered after a crash"))
+        d.setInformativeText(i18n("Restore them?"))
+        d.setDetailedText('\n'.join(p or '' for p, text in recovered))
+        d.setIcon(QtWidgets.QMessageBox.Question)
+        d.setStandardButtons(QtWidgets.QMessageBox.Yes |
+                             QtWidgets.QMessageBox.No)
+        if d.exec_() != QtWidgets.QMessageBox.Yes:
+            return
+        for path, text in recovered:
+            if path and os.path.isfile(path):
+                code_edit = self.openFile(path)
+            else:
+                code_edit = self.fileNew()
+            # an edit, not setPlainText, so it is undoable and marked dirty
+            cursor = code_edit.textCursor()
+            cursor.select(QtGui.QTextCursor.Document)
+            cursor.insertText(text)
+
+    def saveSession(self):
+        files = []
+        current = 0
+        for i in range(self.tabber.count()):
+            widget = self.tabber.widget(i)
+            path = getattr(getattr(widget, 'file', None), 'path', '')
+            if path and os.path.isfile(path):
+                if widget is self.tabber.currentWidget():
+                    current = len(files)
+                files.append(path)
+        self.settings.setValue('session', json.dumps({'files': files,
+                                                      'current': current}))
+
+    def restoreSession(self):
+        try:
+            session = json.loads(self.settings.value('session') or '{}')
+        except (TypeError, ValueError):
+            return
+        files = [f for f in session.get('files', []) if os.path.isfile(f)]
+        for path in files:
+            placeholder = PlaceholderTab(path, self.tabber)
+            self.tabber.addTab(placeholder, QtGui.QIcon(),
+                               placeholder._tab_name)
+            self.tabber.setTabToolTip(self.tabber.indexOf(placeholder), path)
+        if files:
+            current = min(session.get('current', 0), len(files) - 1)
+            self.tabber.setCurrentIndex(current)
+            # setCurrentIndex does not signal when the index stays at 0
+            self.actualizeOutline(current)
+
+    def _realize(self, placeholder):
+        '''replace a placeholder tab by a real editor'''
+        index = self.tabber.indexOf(placeholder)
+        if index < 0 or self.tabber.currentWidget() is not placeholder:
+            return
+        path = placeholder.file.path
+        # free the path, add_code_edit refuses files that are already open
+        placeholder.file.path = None
+        code_edit = self.createEditor()
+        code_edit.file.open(path)
+        i = self._addEditor(code_edit)
+        self.tabber.tabBar().moveTab(i, index)
+        self.tabber.removeTab(self.tabber.indexOf(placeholder))
+        self.tabber.setCurrentWidget(code_edit)
+        return code_edit
+
     def closeEvent(self, event):
+        self.saveSession()
         self.tabber.closeEvent(event)
         if event.isAccepted():
+            if self.journal:
+                self.journal.close()
+            if self.instance:
+                self.instance.close()
+            if self.project:
+                self.project.close()
             self.terminate()
 
     def createEditor(self):
-        return widgets.PyCodeEdit(interpreter=backend_interpreter(),
+        syspath = [fakelibs()]
+        stubs = stubGen.stub_path()
+        if stubs:
+            syspath.insert(0, stubs)
+        editor = widgets.PyCodeEdit(interpreter=backend_interpreter(),
             server_script=completion_server(),
-            args=['-s', fakelibs()])
+            args=['-s'] + syspath)
+        self.i18n(editor.actions())
+        self.analysis.register(editor)
+        return editor
+
+    def _addEditor(self, code_edit, name=None):
+        i = self.tabber.add_code_edit(code_edit, name)
+        if i != -1:
+            self.tabber.setCurrentIndex(i)
+            if self.journal:
+                self.journal.register(code_edit)
+        return i
 
     def fileNew(self):
         code_edit = self.createEditor()
-        i = self.tabber.add_code_edit(code_edit, i18n("NewFile.py (%d)"))
-        self.tabber.setCurrentIndex(i)
+        self._addEditor(code_edit, i18n("NewFile.py (%d)"))
+        return code_edit
 
     def dirtySaveDischartCancel(self):
         d = QtWidgets.QMessageBox()
@@ -338,11 +870,66 @@ class MainWindow(QtWidgets.QMainWindow):
             self, i18n("Open File"), self.cwd,
             i18n("Python files (*.py);;All files (*)"))
         if name:
-            code_edit = self.createEditor()
-            code_edit.file.open(name)
-            i = self.tabber.add_code_edit(code_edit)
+            self.openFile(name)
+
+    def openFile(self, name):
+        # add_code_edit would delete a second editor of the file behind the
+        # scheduler's back, show the one already open instead
+        i = self.tabber.index_from_filename(name)
+        if i == -1:
+            i = self.tabber.index_from_filename(os.path.normpath(name))
+        if i != -1:
+            widget = self.tabber.widget(i)
             self.tabber.setCurrentIndex(i)
-            self.cwd = os.path.dirname(name)
+            if isinstance(widget, PlaceholderTab):
+                # the caller may edit it right away
+                widget = self._realize(widget)
+            return widget
+        code_edit = self.createEditor()
+        code_edit.file.open(name)
+        self._addEditor(code_edit)
+        self.cwd = os.path.dirname(name)
+        return code_edit
+
+    def projectOpen(self):
+        root = QtWidgets.QFileDialog.getExistingDirectory(
+            self, i18n("Open Project"), self.cwd)
+        if root:
+            self.setProject(root)
+
+    def setProject(self, root):
+        if self.project:
+            self.project.close()
+            self.project.deleteLater()
+        self.project = Project(root, self)
+        self.cwd = self.project.root
+        self.settings.setValue('project', self.project.root)
+        self.setWindowTitle('{} - {}'.format(i18n("Edu CIAA MicroPython"),
+                                             os.path.basename(root)))
+
+    def restoreProject(self):
+        root = self.settings.value('project')
+        if root and os.path.isdir(root):
+            self.setProject(root)
+
+    def listenInstances(self):
+        self.instance = InstanceServer(self)
+        self.instance.onFiles.connect(self.openFiles)
+
+    def openFiles(self, names):
+        for name in names:
+            if os.path.isfile(name):
+                self.openFile(name)
+        self.setWindowState(self.windowState() & ~QtCore.Qt.WindowMinimized)
+        self.raise_()
+        self.activateWindow()
+
+    def quickOpen(self):
+        if not self.project:
+            return self.fileOpen()
+        d = QuickOpenDialog(self.project, self)
+        if d.exec_() == QtWidgets.QDialog.Accepted and d.selectedPath():
+            self.openFile(d.selectedPath())
 
     def fileSave(self):
         ed = self.tabber.active_editor
@@ -366,53 +953,264 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def openTerm(self):
         if self.termAction.isChecked():
-            self.stack.setCurrentIndex(1)
+            self.stack.setCurrentWidget(self.terminal())
             self.termAction.setIcon(icon('terminal-out'))
             self.termAction.setText(i18n('To Editor'))
             self.term.setFocus()
-            # self.term.remoteExec(b'\x04')
+            # self.terminal().remoteExec(b'\x04')
         else:
             self.termAction.setIcon(icon('terminal'))
             self.termAction.setText(i18n('Terminal'))
-            self.stack.setCurrentIndex(0)
+            self.stack.setCurrentWidget(self.tabber)
+
+    def boardProfile(self):
+        import memEstimate
+        profiles = memEstimate.load_profiles()
+        return profiles.get(self.settings.value('board'),
+                            profiles[memEstimate.DEFAULT_PROFILE])
+
+    def _fillBoardMenu(self):
+        import memEstimate
+        self.boardMenu.clear()
+        g = QtWidgets.QActionGroup(self.boardMenu)
+        g.triggered.connect(
+            lambda a: self.settings.setValue('board', a.data()))
+        current = self.boardProfile()
+        for key, profile in sorted(memEstimate.load_profiles().items()):
+            a = self.boardMenu.addAction(profile.name)
+            a.setData(key)
+            a.setCheckable(True)
+            a.setChecked(profile == current)
+            g.addAction(a)
+
+    def memoryEstimate(self):
+        import memEstimate
+        ed = self.tabber.active_editor
+        if not ed:
+            return
+        source = ed.toPlainText()
+        profile = self.boardProfile()
+
+        def work():
+            self.onMemReport.emit(memEstimate.estimate_cached(source,
+                                                              profile))
+        threading.Thread(target=work, daemon=True).start()
+
+    def _estimateLater(self, sources):
+        '''estimate sources off the GUI thread, for _memoryCheck'''
+        import memEstimate
+        profile = self.boardProfile()
+
+        def work():
+            for source in sources:
+                memEstimate.estimate_cached(source, profile)
+        threading.Thread(target=work, daemon=True).start()
+
+    def _showMemReport(self, report):
+        import memEstimate
+        d = QtWidgets.QMessageBox(self)
+        d.setWindowTitle(i18n("Memory"))
+        if report.error or report.risks:
+            d.setIcon(QtWidgets.QMessageBox.Warning)
+            d.setText(i18n("Possible MemoryError on the board"))
+        else:
+            d.setIcon(QtWidgets.QMessageBox.Information)
+            d.setText(i18n("Script should fit on the board"))
+        d.setInformativeText('~{} / {} bytes'.format(report.total,
+                                                     report.profile.heap))
+        d.setDetailedText(memEstimate.format_report(report))
+        d.exec_()
+
+    def _memoryCheck(self, sources, proceed):
+        '''warn before sending scripts that may not fit, proceed is called
+           to go on. Sources not estimated yet are estimated off the GUI
+           thread first
+        '''
+        import memEstimate
+        profile = self.boardProfile()
+        reports = [memEstimate.cached(source, profile)
+                   for name, source in sources]
+        if None not in reports:
+            self._memoryChecked((sources, reports, proceed))
+            return
+        self.statusBar().showMessage(i18n("Estimating memory..."), 2000)
+
+        def work():
+            reports = [memEstimate.estimate_cached(source, profile)
+                       for name, source in sources]
+            self.onMemChecked.emit((sources, reports, proceed))
+        threading.Thread(target=work, daemon=True).start()
+
+    def _memoryChecked(self, pending):
+        import memEstimate
+        sources, reports, proceed = pending
+        details = ['{}\n{}'.format(name, memEstimate.format_report(report))
+                   for (name, source), report in zip(sources, reports)
+                   if report.risks]
+        if details and not self._memoryConfirm(details):
+            return
+        proceed()
+
+    def _memoryConfirm(self, details):
+        d = QtWidgets.QMessageBox(self)
+        d.setWindowTitle(i18n("Memory"))
+        d.setIcon(QtWidgets.QMessageBox.Warning)
+        d.setText(i18n("Possible MemoryError on the board"))
+        d.setInformativeText(i18n("Continue anyway?"))
+        d.setDetailedText('\n\n'.join(details))
+        d.setStandardButtons(QtWidgets.QMessageBox.Yes |
+                             QtWidgets.QMessageBox.No)
+        return d.exec_() == QtWidgets.QMessageBox.Yes
+
+    def _editorSources(self):
+        editor = self.tabber.active_editor
+        return [(editor.file.path or '<editor>', editor.toPlainText())]
 
     def progRun(self):
-        self._targetExec(self.tabber.active_editor.toPlainText())
+        sources = self._editorSources()
+        self._memoryCheck(sources, lambda: self._progRun(sources[0][1]))
+
+    def _progRun(self, source):
+        self._targetExec(source)
         self.termAction.setChecked(True)
         self.openTerm()
 
-    def _targetExec(self, script, continuation=None):
-        def progrun2(text):
-            # print("{} {}".format(4, progrun2.text))
-            progrun2.text += text
-            if progrun2.text.endswith(b'\x04>'):
-                # print("{} {}".format(5, progrun2.text))
-                if isinstance(continuation, collections.Callable):
-                    continuation(progrun2.text)
-                return True
-            return False
+    def runCell(self):
+        '''run the selection, or the cell at the cursor, in the live REPL'''
+        import replSession
+        editor = self.tabber.active_editor
+        cursor = editor.textCursor()
+        if cursor.hasSelection():
+            source = cursor.selectedText().replace(u'\u2029', '\n')
+            line = editor.document().findBlock(
+                cursor.selectionStart()).blockNumber()
+        else:
+            line, source = replSession.cell_at(editor.toPlainText(),
+                                               cursor.blockNumber())
+        source = replSession.runnable(source)
+        if not source:
+            return
+        title = '{} {}: {}'.format(os.path.basename(editor.file.path or '') or
+                                   i18n("New"), line + 1,
+                                   source.split('\n')[0])
+        self._targetExec(source,
+                         lambda raw: self.onCellDone.emit((title, raw)))
+
+    def _cellDone(self, result):
+        import replSession
+        title, raw = result
+        out, err = replSession.split_output(raw)
+        self.cellOutput.addRun(title, out, err)
+
+    def reloadModule(self):
+        '''upload the active module and import it again in the live REPL'''
+        import replSession
+        editor = self.tabber.active_editor
+        path = editor.file.path
+        if not path:
+            return
+        if self.project and not self.project.index.relpath(
+                path).startswith('..'):
+            remote_name = '/flash/' + self.project.index.relpath(path)
+        else:
+            remote_name = '/flash/' + os.path.basename(path)
+        name = replSession.module_name(remote_name)
+        if not name:
+            return
+        sources = self._editorSources()
+        self._memoryCheck(sources, lambda: self._reloadModule(
+            remote_name, name, sources[0][1].encode('utf-8')))
+
+    def _reloadModule(self, remote_name, name, data):
+        import deltaUpload
+        self._pendingReload = (remote_name, name)
+        if len(data) >= deltaUpload.MIN_SIZE:
+            self.deltaUpload(remote_name, data)
+        else:
+            self.uploadBundle([(remote_name, data)])
 
-        def progrun1(text):
-            progrun1.text += text
-            # print("{} {}".format(2, progrun1.text))
-            if progrun1.text.endswith(b'to exit\r\n>'):
-                progrun2.text = b''
-                # print("{} {}".format(3, progrun1.text))
-                cmd = 'print("\033c")\r{}\r\x04\x02'.format(script)
-                # print("{} {}".format(3.5, cmd))
-                self.term.remoteExec(bytes(cmd, 'utf-8'), progrun2)
+    def _reloaded(self, result):
+        import replSession
+        name, raw = result
+        if replSession.reloaded(raw):
+            print(('Reloaded ', name))
+            return
+        QtWidgets.QMessageBox.warning(
+            self, i18n("Reload module"),
+            i18n("Reload failed:") + ' ' + name + '\n' +
+            raw.decode(errors='ignore').strip('\x04>\r\n'))
+
+    def _targetExec(self, script, continuation=None, timeout=None):
+        '''run script in the raw REPL, continuation gets its output. Only
+           the IDE's own transfers and probes give a timeout, user code may
+           stay silent as long as it likes and is only stopped by the user
+           :returns: a RemoteOp handle, cancelling it detaches the run
+        '''
+        def progrun(text):
+            progrun.text += text
+            if progrun.script is not None:
+                if progrun.text.endswith(b'to exit\r\n>'):
+                    # Ctrl-B only once the script is over, scripts reading
+                    # stdin would get it otherwise
+                    cmd = 'print("\033c")\r{}\r\x04'.format(progrun.script)
+                    progrun.script = None
+                    progrun.text = b''
+                    self.terminal().remoteExec(bytes(cmd, 'utf-8'))
+                else:
+                    # only the end is looked at
+                    progrun.text = progrun.text[-16:]
+                return False
+            if progrun.text.endswith(b'\x04>'):
+                # back to the friendly REPL
+                self.terminal().write(b'\x02')
+                if callable(continuation):
+                    continuation(progrun.text)
                 return True
+            if not callable(continuation):
+                progrun.text = progrun.text[-2:]
             return False
-        progrun1.text = b''
-        # print(1)
-        self.term.remoteExec(b'\r\x03\x03\r\x01', progrun1)
+        progrun.text = b''
+        progrun.script = script
+        if self._targetOp:
+            # the board is interrupted, a previous run is over
+            self._targetOp.cancel()
+        self._targetOp = self.terminal().remoteExec(
+            b'\r\x03\x03\r\x01', progrun, timeout,
+            lambda: self.onTimeout.emit(script))
+        return self._targetOp
+
+    def _internalExec(self, script, continuation):
+        '''_targetExec for the IDE's own scripts, given up when the board
+           stays silent'''
+        return self._targetExec(script, continuation, EXEC_TIMEOUT)
+
+    def _remoteTimeout(self, script):
+        print(('Board did not answer, gave up running: ', script[:200]))
+        self.statusBar().showMessage(i18n("The board did not answer"), 5000)
+        # stop what may still run and leave the raw REPL
+        self.terminal().remoteExec(b'\x03\x02')
 
     def showDir(self):
         def finished(raw):
             text = ''.join(re.findall(r"(\[.*?\])", raw.decode()))
             print((raw, text))
             self.onListDir.emit(text)
-        self._targetExec('print(os.listdir())', finished)
+        self._internalExec('print(os.listdir())', finished)
+
+    def generateStubs(self):
+        def finished(raw):
+            self.onStubs.emit(raw)
+        self._targetExec(stubGen.introspect_script(), finished)
+
+    def _saveStubs(self, raw):
+        firmware, modules = stubGen.parse_result(raw)
+        if not modules:
+            print(('generateStubs failed: ', raw))
+            return
+        path = stubGen.write_stubs(firmware, modules)
+        QtWidgets.QMessageBox.information(
+            self, i18n("Generate stubs"),
+            i18n("Stubs saved, used by new editors:") + '\n' + path)
 
     def _showDir(self, text):
         items = eval(text)
@@ -426,8 +1224,7 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def _writeRemoteFile(self, local_name):
         '''upload local file to remote device (target board)'''
-        def finished(raw):
-            print(('_writeRemoteFile terminated: ', raw))
+        import deltaUpload
         name = os.path.basename(local_name)
         name, ok = QtWidgets.QInputDialog.getText(self, i18n("Download"),
                                                   i18n("Remote Name"),
@@ -440,30 +1237,167 @@ class MainWindow(QtWidgets.QMainWindow):
                 data = f.read()
         else:
             data = self.tabber.active_editor.toPlainText()
-        cmd = "with open(\"{}\", 'wb') as f:\r" \
-              "    f.write({})".format(remote_name, repr(data))
-        print(("Writing remote to ", remote_name, repr(data)))
-        print(("--------------\n", cmd, "\n--------------"))
-        self._targetExec(cmd, finished)
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if len(data) >= deltaUpload.MIN_SIZE:
+            self.deltaUpload(remote_name, data)
+        else:
+            self.uploadBundle([(remote_name, data)])
+
+    def deployProject(self):
+        '''upload the project files reachable from main.py and boot.py'''
+        if not self.project:
+            return
+        graph = self.project.graph
+        files, builtin, missing = graph.reachable()
+        graph.save()
+        if not files:
+            QtWidgets.QMessageBox.information(
+                self, i18n("Deploy"), i18n("No main.py or boot.py in project"))
+            return
+        if missing:
+            print(('Deploy: modules not found, expected on the board: ',
+                   sorted(missing)))
+        contents = []
+        for rel in sorted(files):
+            with open(self.project.index.abspath(rel), 'rb') as f:
+                contents.append(('/flash/' + rel, f.read()))
+        self._memoryCheck([(path, data.decode(errors='ignore'))
+                           for path, data in contents
+                           if path.endswith('.py')],
+                          lambda: self.uploadBundle(contents))
+
+    def uploadBundle(self, files):
+        '''upload many (remote_path, data) files in one raw REPL session'''
+        import bundle
+        def finished(raw):
+            self.onBundleDone.emit(([path for path, data in files], raw))
+
+        def probed(raw):
+            self.onProbe.emit((files, raw))
+        if not self._probed:
+            # once per board, can it inflate compressed files?
+            self._internalExec(bundle.PROBE, probed)
+            return
+        print(('Bundle upload: ', [path for path, data in files]))
+        self._internalExec(bundle.UNPACKER, finished)
+        sender = bundle.BundleSender(files, self.terminal().write,
+                                     self.inflater, self.baud)
+        self.terminal().remoteExec(b'', sender, TRANSFER_TIMEOUT)
+
+    def _probeDone(self, pending):
+        import bundle
+        files, raw = pending
+        self.inflater = bundle.parse_probe(raw)
+        self._probed = True
+        print(('Board inflater: ', self.inflater))
+        if not bundle.crc_checked(raw):
+            print('Board has no crc32, upload lines are not checked')
+            self.statusBar().showMessage(
+                i18n("The board can not check the uploaded lines"), 10000)
+        self.uploadBundle(files)
+
+    def deltaUpload(self, remote_name, data):
+        '''upload only the blocks of data the remote file does not have'''
+        import deltaUpload
+        def finished(raw):
+            self.onSignature.emit((remote_name, data, raw))
+        self._internalExec(deltaUpload.signature_script(remote_name),
+                           finished)
+
+    def _sendDelta(self, pending):
+        import bundle
+        import deltaUpload
+        remote_name, data, raw = pending
+        signature = deltaUpload.parse_signature(raw)
+        ops = deltaUpload.make_delta(data, signature) if signature else None
+        if not ops or deltaUpload.literal_size(ops) > len(data) * 3 // 4:
+            # new or mostly rewritten file
+            self.uploadBundle([(remote_name, data)])
+            return
+
+        def finished(raw):
+            self.onBundleDone.emit(([remote_name], raw))
+        print(('Delta upload: ', remote_name, deltaUpload.literal_size(ops),
+               'of', len(data), 'bytes'))
+        self._internalExec(deltaUpload.patcher_script(remote_name), finished)
+        sender = bundle.StreamSender(deltaUpload.delta_lines(ops, data),
+                                     self.terminal().write)
+        self.terminal().remoteExec(b'', sender, TRANSFER_TIMEOUT)
+
+    def _bundleDone(self, result):
+        import bundle
+        import replSession
+        paths, raw = result
+        ok, bad = bundle.parse_result(raw)
+        print(('Bundle upload written: ', ok))
+        if bad:
+            QtWidgets.QMessageBox.warning(
+                self, i18n("Deploy"),
+                i18n("Files corrupted during upload:") + '\n' +
+                '\n'.join(bad))
+        if self._pendingReload:
+            remote_name, name = self._pendingReload
+            self._pendingReload = None
+            if remote_name in ok:
+                self._targetExec(replSession.reload_script(name),
+                                 lambda raw: self.onReloaded.emit((name, raw)))
+        cut = [path for path in paths if path not in ok and path not in bad]
+        if cut:
+            print(('Bundle upload interrupted: ', raw))
+            QtWidgets.QMessageBox.warning(
+                self, i18n("Deploy"),
+                i18n("Upload interrupted, upload again to resume:") + '\n' +
+                '\n'.join(cut))
 
     def progDownload(self):
-        self._writeRemoteFile(self.tabber.active_editor.file.path)
+        path = self.tabber.active_editor.file.path
+        self._memoryCheck(self._editorSources(),
+                          lambda: self._writeRemoteFile(path))
 
 global app
 
 
 def main():
+    import tendo.singleton
+    # still guards against two launches racing before one is listening
+    lock = tendo.singleton.SingleInstance()
+    timer = phaseTimer.PhaseTimer()
     app = QtWidgets.QApplication(sys.argv)
+    # the lock is held as long as the application lives
+    app._instance_lock = lock
     app.setQuitOnLastWindowClosed(True)
+    timer.mark('application')
     splash = QtWidgets.QSplashScreen()
     splash.setPixmap(about_pixmap())
     splash.show()
-
-    def do_app():
-        splash.close()
-        w = MainWindow()
-        w.show()
-    QtCore.QTimer.singleShot(2000, do_app)
+    app.processEvents()
+    timer.mark('splash')
+    w = MainWindow(timer)
+    w.listenInstances()
+    w.show()
+    timer.mark('window shown')
+
+    def ready():
+        splash.finish(w)
+        timer.mark('ready')
+        w.portSelector.refresh()
+        timer.mark('serial port')
+        w.restoreProject()
+        timer.mark('project')
+        w.startJournal()
+        timer.mark('journal')
+        w.restoreSession()
+        timer.mark('session')
+        files = [f for f in sys.argv[1:] if os.path.isfile(f)]
+        if files:
+            w.openFiles(files)
+            timer.mark('files')
+        if not w.tabber.count():
+            w.fileNew()
+            timer.mark('first editor')
+        print(timer.report())
+    QtCore.QTimer.singleShot(0, ready)
     sys.exit(app.exec_())
 
 if __name__ == "__main__":